@@ -0,0 +1,48 @@
+""" Benchmark of the layout and draw passes on deeply nested documents, to
+    show that the time per level stays constant as the depth grows. Run with
+    `python benchmarks/deep_nesting.py [depth ...]`. The debug representation
+    is not included, since its indentation makes its length quadratic in the
+    depth """
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from layoutimg.layoutnode import LayoutNode
+from layoutimg.renderer import ImageRenderer
+
+def nested_xml(depth: int):
+    """ Get a layout with the given number of nested rows around some text """
+    return ("<image>" + "<row>" * depth + "<text font-size='12'>Deep</text>" +
+    "</row>" * depth + "</image>")
+
+def benchmark(depth: int):
+    """ Time all passes over a layout of the given depth, returned as a
+        dictionary of pass names to seconds """
+    times = {}
+    element = ElementTree.fromstring(nested_xml(depth))
+    passes = [
+        ("build", lambda: LayoutNode(element)),
+        ("inherit", lambda: tree.propagate_inherit()),
+        ("layout", lambda: tree.propagate_pos()),
+        ("draw", lambda: tree.draw(ImageRenderer(*tree.bounds()))),
+    ]
+    tree = None
+    for name, run in passes:
+        start = time.perf_counter()
+        result = run()
+        times[name] = time.perf_counter() - start
+        if name == "build":
+            tree = result
+    return times
+
+def main():
+    depths = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    print(f"{'depth':>8} " + " ".join(f"{name:>16}" for name in
+    ("build", "inherit", "layout", "draw")))
+    for depth in depths:
+        times = benchmark(depth)
+        # Report microseconds per level, which should stay roughly constant
+        print(f"{depth:>8} " + " ".join(f"{seconds / depth * 1e6:>13.2f}us"
+        for seconds in times.values()))
+
+if __name__ == "__main__":
+    main()
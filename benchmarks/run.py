@@ -0,0 +1,188 @@
+""" Benchmark suite that times parsing, layout, drawing and saving separately
+    for every example layout and for generated layouts of increasing size.
+    Every case runs in a fresh process, so the peak memory use is measured per
+    case, and caches are cleared before every repetition so all runs do the
+    same work. Run from anywhere with `python benchmarks/run.py`, optionally
+    with `--output results.json` to store the results and `--baseline
+    results.json` to compare against earlier results. The exit code is 1 if a
+    case got slower than the threshold allows """
+import argparse
+import glob
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import PIL
+from layoutimg import LayoutImage, __version__
+from layoutimg.profiling import Tracer
+from layoutimg.renderer import font_cache, image_cache, text_metrics
+from deep_nesting import nested_xml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE = "examples/image-import/Hello-World.png"
+# Phases reported per case, in the order they happen
+PHASES = ("parse", "layout", "draw", "save")
+
+def checkerboard_xml(n: int):
+    """ Get a layout of n by n alternating black and white squares """
+    rows = "".join("<row>" + "".join(f"<col width='10' height='10' "
+    f"background-color='{('black', 'white')[(x + y) % 2]}'/>" for x in
+    range(n)) + "</row>" for y in range(n))
+    return f"<image>{rows}</image>"
+
+def text_rows_xml(n: int):
+    """ Get a layout of n rows with a long line of text each """
+    line = " ".join(f"word{i}" for i in range(40))
+    return "<image>" + "".join(f"<row><text font-size='14'>{i} {line}</text>"
+    "</row>" for i in range(n)) + "</image>"
+
+def images_xml(n: int):
+    """ Get a layout of n background images in a grid, with a few different
+        sizes so that decoding and resizing are both included """
+    cols = "".join(f"<col width='{20 + i % 5}' height='20' "
+    f"background-image='{IMAGE}'/>" for i in range(n))
+    return f"<image><row>{cols}</row></image>"
+
+def col_fan_xml(n: int):
+    """ Get a layout of a single row with n text columns next to each other
+        """
+    cols = "".join(f"<col background-color='#{i * 37 % 256:02x}8080'><text "
+    f"font-size='12'>{i}</text></col>" for i in range(n))
+    return f"<image><row>{cols}</row></image>"
+
+# Generated families of layouts, with the sizes to generate for a normal and a
+# quick run
+FAMILIES = {
+    "checkerboard": (checkerboard_xml, (10, 50, 100), (10, 30)),
+    "deep-nesting": (nested_xml, (100, 1000, 10000), (100, 1000)),
+    "text-rows": (text_rows_xml, (10, 100, 500), (10, 50)),
+    "background-images": (images_xml, (10, 100, 1000), (10, 100)),
+    "col-fan": (col_fan_xml, (10, 100, 1000), (10, 100)),
+}
+
+def cases(quick: bool):
+    """ Get all benchmark cases as a dictionary of names to XML texts """
+    result = {}
+    for path in sorted(glob.glob("examples/**/*.xml", recursive=True)):
+        with open(path, "r") as input_file:
+            result[path] = input_file.read()
+    for family, (generate, sizes, quick_sizes) in FAMILIES.items():
+        for size in quick_sizes if quick else sizes:
+            result[f"{family}/{size}"] = generate(size)
+    return result
+
+def run_once(text: str):
+    """ Render a layout once with empty caches, and return the seconds per
+        phase and the number of nodes and pixels """
+    text_metrics.clear()
+    font_cache.clear()
+    image_cache.clear()
+    tracer = Tracer()
+    start = time.perf_counter()
+    image = LayoutImage(text, tracer=tracer)
+    parsed = time.perf_counter()
+    image.generate()
+    generated = time.perf_counter()
+    image.save(io.BytesIO())
+    saved = time.perf_counter()
+    draw = tracer.phases["draw"][1]
+    times = {
+        "parse": parsed - start,
+        "layout": generated - parsed - draw,
+        "draw": draw,
+        "save": saved - generated,
+    }
+    renderer = image._renderer
+    return times, tracer.counters["nodes"], renderer.width * renderer.height
+
+def run_case(text: str, repeats: int):
+    """ Benchmark a single layout, using the fastest of a number of repetitions
+        per phase. Should be run in a fresh process to measure peak memory """
+    best = {phase: float("inf") for phase in PHASES}
+    for _ in range(repeats):
+        times, nodes, pixels = run_once(text)
+        for phase in PHASES:
+            best[phase] = min(best[phase], times[phase])
+    total = sum(best.values())
+    # The maximum resident set size is in kilobytes on Linux, but in bytes on
+    # macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss //= 1024
+    return {
+        **{f"{phase}_seconds": best[phase] for phase in PHASES},
+        "total_seconds": total,
+        "renders_per_second": 1 / total if total > 0 else 0.0,
+        "megapixels_per_second": pixels / 1e6 / total if total > 0 else 0.0,
+        "nodes": nodes,
+        "pixels": pixels,
+        "peak_rss_kb": rss,
+    }
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """ Compare results to a baseline and return the names of the cases that
+        got slower by more than the threshold (as a fraction) """
+    regressions = []
+    for name, case in results["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        old = baseline["cases"][name]["total_seconds"]
+        new = case["total_seconds"]
+        if old > 0 and new > old * (1 + threshold):
+            regressions.append(name)
+            print(f"REGRESSION {name}: {old * 1000:.2f}ms -> "
+            f"{new * 1000:.2f}ms ({(new / old - 1) * 100:+.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5, help="number of "
+    "repetitions per case, of which the fastest is reported")
+    parser.add_argument("--quick", action="store_true", help="use smaller "
+    "sizes for the generated layouts")
+    parser.add_argument("--filter", default="", help="only run cases with "
+    "this text in their name")
+    parser.add_argument("--output", help="file to write the results to as "
+    "JSON")
+    parser.add_argument("--baseline", help="JSON file with earlier results to "
+    "compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed "
+    "slowdown compared to the baseline, as a fraction (default 0.1)")
+    args = parser.parse_args()
+    os.chdir(ROOT)
+    results = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "repeats": args.repeats,
+        "cases": {},
+    }
+    print(f"{'case':<42} " + " ".join(f"{phase:>9}" for phase in PHASES) +
+    f" {'renders/s':>10} {'MP/s':>8} {'RSS MB':>7}")
+    context = multiprocessing.get_context("spawn")
+    for name, text in cases(args.quick).items():
+        if args.filter not in name:
+            continue
+        with context.Pool(1) as pool:
+            case = pool.apply(run_case, (text, args.repeats))
+        results["cases"][name] = case
+        print(f"{name:<42} " + " ".join(f"{case[f'{phase}_seconds'] * 1000:>7.2f}"
+        f"ms" for phase in PHASES) + f" {case['renders_per_second']:>10.1f} "
+        f"{case['megapixels_per_second']:>8.2f} "
+        f"{case['peak_rss_kb'] / 1024:>7.1f}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
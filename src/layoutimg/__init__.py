@@ -1,9 +1,54 @@
+import importlib as _importlib
 
-from importlib import resources as _resources
-import tomli as _tomli
-
-from .layoutimg import LayoutImage
+# Same as typing.TYPE_CHECKING, without importing typing
+_TYPE_CHECKING = False
+if _TYPE_CHECKING:
+    from typing import Iterable
 
 __version__ = "0.2.0"
 
-CONFIG = _tomli.loads(_resources.read_text("layoutimg", "config.toml"))
\ No newline at end of file
+__all__ = ["BudgetExceededError", "CONFIG", "LayoutDocument", "LayoutError",
+"LayoutImage", "LayoutTemplate", "RenderBudget", "preload"]
+
+# Public classes and the modules they are defined in. These are only imported
+# when first used, so importing the package does not load Pillow
+_LAZY = {
+    "BudgetExceededError": ".budget",
+    "LayoutDocument": ".layoutdocument",
+    "LayoutError": ".layoutnode",
+    "LayoutImage": ".layoutimg",
+    "LayoutTemplate": ".layouttemplate",
+    "RenderBudget": ".budget",
+}
+
+def __getattr__(name: str):
+    """ Import the public classes and read the config when first used """
+    if name in _LAZY:
+        value = getattr(_importlib.import_module(_LAZY[name], __name__), name)
+    elif name == "CONFIG":
+        from importlib import resources
+        import tomli
+        value = tomli.loads(resources.read_text("layoutimg", "config.toml"))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+def preload(fonts: 'Iterable[tuple[None | str, int]]' = (),
+images: 'Iterable[str]' = ()):
+    """ Import the modules needed for rendering, and load the default font,
+        the given fonts (as path and size) and the images in the given
+        directories into the shared caches. Calling this before forking worker
+        processes lets all workers share the loaded modules and caches, instead
+        of loading them again in every worker """
+    # Importing the layout image module imports all rendering modules
+    _importlib.import_module(".layoutimg", __name__)
+    from .renderer import font_cache, image_cache
+    font_cache.get()
+    for font, font_size in fonts:
+        font_cache.get(font, font_size)
+    for directory in images:
+        image_cache.preload(directory)
@@ -1,20 +1,105 @@
-
+import argparse
 import sys
-from .layoutimg import LayoutImage
 
 def main():
-    """ Generate one of the examples using the main function """
-    if len(sys.argv) <= 1:
-        print("Generate a layout image given by its path name. The output fill "
-        "have the same name as the input file, but with a PNG extension.")
+    """ Generate one or more layout images from XML files, or run a render
+        server with `layoutimg serve` """
+    if sys.argv[1:2] == ["serve"]:
+        serve_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(prog="layoutimg",
+    description="Generate layout images given by their path names. The "
+    "output will have the same name as the input file, but with a PNG "
+    "extension.")
+    parser.add_argument("inputs", nargs="*", help="XML files, directories to "
+    "search for XML files, or glob patterns")
+    parser.add_argument("--stdin", action="store_true", help="read a list of "
+    "input files from stdin, one per line")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of "
+    "worker processes to render with")
+    parser.add_argument("--tile-size", type=int, default=None, help="render "
+    "in square tiles of this size, which limits memory use for large images")
+    parser.add_argument("--cache-dir", default=None, help="directory of a "
+    "render cache to reuse images of identical layouts from")
+    parser.add_argument("--layout", action="store_true", help="only compute "
+    "the layout and write the element boxes to a JSON file with a JSON "
+    "extension, instead of rendering an image")
+    parser.add_argument("--profile", action="store_true", help="print the "
+    "time spent per rendering phase and counters of the work done")
+    parser.add_argument("--assets", action="append", default=[],
+    metavar="DIR", help="directory of images to decode once before "
+    "rendering, which is shared by all worker processes; can be repeated")
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    # Only imported after parsing the arguments, so printing the help does
+    # not load Pillow and the rendering modules
+    from .batch import RenderResult, find_files, run_batch
+    inputs = list(args.inputs)
+    if args.stdin:
+        inputs.extend(line.strip() for line in sys.stdin if line.strip())
+    if not inputs:
+        parser.print_help()
         return
-    input_filename = sys.argv[1]
-    output_filename = input_filename + ".png"
-    with open(input_filename, "r") as input_file:
-        text = input_file.read()
-    image = LayoutImage(text)
-    image.generate()
-    image.save(output_filename)
+    paths = list(find_files(inputs))
+    budget = parse_budget(args)
+    def on_result(result: RenderResult):
+        if result.error is not None:
+            print(f"{result.path}: {result.error}", file=sys.stderr)
+    summary = run_batch(paths, jobs=args.jobs, on_result=on_result,
+    tile_size=args.tile_size, cache_dir=args.cache_dir,
+    layout=args.layout, profile=args.profile, assets=args.assets,
+    budget=budget)
+    if len(paths) > 1:
+        print(summary.report(), file=sys.stderr)
+    if summary.tracer is not None:
+        print(summary.tracer.report(), file=sys.stderr)
+    if summary.failures:
+        sys.exit(1)
+
+def serve_main(argv: 'list[str]'):
+    """ Run a render server until it is interrupted or terminated """
+    parser = argparse.ArgumentParser(prog="layoutimg serve",
+    description="Run a local HTTP server rendering layouts to PNG images. "
+    "Post XML, or JSON with the XML in \"xml\" and template data in "
+    "\"data\", to /render. Latencies and cache statistics are available "
+    "from /metrics.")
+    parser.add_argument("--host", default="127.0.0.1", help="host to listen "
+    "on")
+    parser.add_argument("--port", type=int, default=8000, help="port to "
+    "listen on")
+    parser.add_argument("--socket", default=None, help="path of a Unix "
+    "socket to listen on instead of a host and port")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+    help="number of renders to run at the same time, by default the number "
+    "of CPUs")
+    add_budget_arguments(parser)
+    args = parser.parse_args(argv)
+    # Only imported when serving, since the HTTP modules are slow to import
+    from .server import serve
+    address = args.socket if args.socket is not None else (args.host,
+    args.port)
+    serve(address, args.workers, parse_budget(args))
+
+def add_budget_arguments(parser: argparse.ArgumentParser):
+    """ Add the arguments limiting the resources of every render """
+    parser.add_argument("--max-pixels", type=int, default=None, help="fail "
+    "renders of images with more pixels than this")
+    parser.add_argument("--max-nodes", type=int, default=None, help="fail "
+    "renders of layouts with more elements than this")
+    parser.add_argument("--max-image-bytes", type=int, default=None,
+    help="fail renders that would decode more bytes of background images "
+    "than this")
+    parser.add_argument("--deadline", type=float, default=None, help="fail "
+    "renders taking longer than this number of seconds")
+
+def parse_budget(args: argparse.Namespace):
+    """ Get the render budget given by the arguments, or None if no limits
+        are given """
+    # Imported here, since it imports Pillow
+    from .budget import RenderBudget
+    budget = RenderBudget(args.max_pixels, args.max_nodes,
+    args.max_image_bytes, args.deadline)
+    return None if budget == RenderBudget() else budget
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,70 @@
+
+from concurrent.futures import Executor
+from functools import partial
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, TypeVar
+from weakref import WeakKeyDictionary
+import os
+
+if TYPE_CHECKING:
+    import asyncio
+
+T = TypeVar("T")
+
+class RenderExecutor:
+    """ Runs renders from asyncio code on an executor, so the event loop is
+        never blocked by drawing or encoding. At most a limited number of
+        renders run at the same time, per event loop. Other renders wait for a
+        free slot, which slows down callers that submit renders faster than
+        they can be done """
+
+    def __init__(self, executor: 'None | Executor' = None,
+    max_concurrency: 'None | int' = None):
+        """ Constructor, given the executor to run renders on (by default the
+            default executor of the event loop) and the maximum number of
+            renders running at the same time (by default the number of CPUs) """
+        self.executor = executor
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        # Semaphores are bound to an event loop, so there is one per loop
+        self._semaphores: 'WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = WeakKeyDictionary()
+        self._lock = Lock()
+        self.running = 0
+        self.waiting = 0
+
+    async def run(self, function: 'Callable[..., T]', *args, **kwargs) -> T:
+        """ Run a function with the given arguments on the executor once a
+            slot is free, and return its result """
+        # Imported here, since asyncio is slow to import and is always loaded
+        # already when this is called
+        import asyncio
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop)
+        self._add(waiting=1)
+        try:
+            await semaphore.acquire()
+        finally:
+            self._add(waiting=-1)
+        self._add(running=1)
+        try:
+            return await loop.run_in_executor(self.executor,
+            partial(function, *args, **kwargs))
+        finally:
+            self._add(running=-1)
+            semaphore.release()
+
+    def _semaphore(self, loop: 'asyncio.AbstractEventLoop'):
+        """ Get the semaphore limiting the renders on an event loop """
+        import asyncio
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._semaphores[loop]
+
+    def _add(self, running: int = 0, waiting: int = 0):
+        """ Update the number of running and waiting renders """
+        with self._lock:
+            self.running += running
+            self.waiting += waiting
+
+# The executor used by async renders if no other executor is given
+render_executor = RenderExecutor()
@@ -0,0 +1,183 @@
+
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+as_completed, wait)
+from functools import lru_cache
+from typing import Callable, Iterable, NamedTuple
+import glob
+import math
+import os
+import time
+from . import preload
+from .budget import RenderBudget
+from .layoutimg import LayoutImage
+from .profiling import Tracer
+from .rendercache import RenderCache
+
+class RenderResult(NamedTuple):
+    """ The result of rendering a single file. The error is None if rendering
+        succeeded. The tracer is only set if the render was profiled """
+    path: str
+    seconds: float
+    error: 'None | str'
+    tracer: 'None | Tracer' = None
+
+@lru_cache(maxsize=None)
+def _render_cache(directory: str):
+    """ Get the render cache for a directory, shared by all renders in this
+        process """
+    return RenderCache(directory)
+
+def render_file(path: str, tile_size: 'None | int' = None,
+cache_dir: 'None | str' = None, layout: bool = False, profile: bool = False,
+budget: 'None | RenderBudget' = None):
+    """ Render the layout in the given XML file to a PNG file with the same
+        name, with a PNG extension appended. If a tile size is given, the image
+        is rendered in tiles of that size. If a cache directory is given, a
+        render cache in that directory is used. If layout is true, nothing is
+        rendered and the element boxes are written to a JSON file instead, with
+        a JSON extension appended. If profile is true, the result contains a
+        tracer with the time spent per phase. If a budget is given, renders
+        that would exceed it fail. Errors are returned as part of the result
+        instead of raised """
+    start = time.perf_counter()
+    tracer = Tracer() if profile else None
+    try:
+        if layout:
+            text = LayoutImage.from_file(path, tracer=tracer).layout_json()
+            with open(path + ".json", "w") as output_file:
+                output_file.write(text)
+        elif tile_size is not None:
+            LayoutImage.from_file(path, tracer=tracer).save_tiled(
+            path + ".png", tile_size, budget)
+        elif cache_dir is not None:
+            with open(path, "r") as input_file:
+                image = LayoutImage(input_file.read(), tracer=tracer)
+            image.generate(cache=_render_cache(cache_dir), budget=budget)
+            image.save(path + ".png")
+        else:
+            image = LayoutImage.from_file(path, tracer=tracer)
+            image.generate(budget=budget)
+            image.save(path + ".png")
+    except Exception as e:
+        return RenderResult(path, time.perf_counter() - start,
+        f"{e.__class__.__name__}: {e}", tracer)
+    return RenderResult(path, time.perf_counter() - start, None, tracer)
+
+def find_files(inputs: 'Iterable[str]'):
+    """ Expand a list of inputs to XML file paths. Inputs can be file paths,
+        directories (searched recursively for XML files) or glob patterns """
+    for name in inputs:
+        if os.path.isdir(name):
+            yield from sorted(glob.glob(os.path.join(name, "**", "*.xml"),
+            recursive=True))
+        elif glob.has_magic(name):
+            yield from sorted(glob.glob(name, recursive=True))
+        else:
+            yield name
+
+class BatchSummary:
+    """ Statistics about a batch of renders """
+
+    def __init__(self):
+        """ Constructor """
+        self.results: 'list[RenderResult]' = []
+        self._start = time.perf_counter()
+        self._end: 'None | float' = None
+
+    def add(self, result: RenderResult):
+        """ Add the result of a single render """
+        self.results.append(result)
+
+    def finish(self):
+        """ Mark the batch as finished, which stops the clock """
+        self._end = time.perf_counter()
+
+    @property
+    def seconds(self):
+        """ The wall-clock time the batch has taken so far """
+        end = time.perf_counter() if self._end is None else self._end
+        return end - self._start
+
+    @property
+    def failures(self):
+        """ The results of renders that failed """
+        return [result for result in self.results if result.error is not None]
+
+    @property
+    def tracer(self):
+        """ A tracer combining the profiles of all profiled renders, or None if
+            no renders were profiled """
+        tracers = [result.tracer for result in self.results
+        if result.tracer is not None]
+        if not tracers:
+            return None
+        combined = Tracer()
+        for tracer in tracers:
+            combined.merge(tracer)
+        return combined
+
+    def percentile(self, p: float):
+        """ Get a percentile (between 0 and 100) of the render latencies in
+            seconds, using the nearest-rank method """
+        latencies = sorted(result.seconds for result in self.results)
+        if not latencies:
+            return 0.0
+        rank = max(1, math.ceil(p / 100 * len(latencies)))
+        return latencies[rank - 1]
+
+    def report(self):
+        """ Get a human readable report of the batch """
+        count = len(self.results)
+        throughput = count / self.seconds if self.seconds > 0 else 0.0
+        lines = [
+            f"Rendered {count - len(self.failures)}/{count} files in "
+            f"{self.seconds:.2f}s ({throughput:.1f} files/s)",
+            "Latency: " + ", ".join(f"p{p}={self.percentile(p) * 1000:.1f}ms"
+            for p in (50, 90, 99, 100)),
+        ]
+        if self.failures:
+            lines.append(f"Failures: {len(self.failures)}")
+        return "\n".join(lines)
+
+def run_batch(paths: 'Iterable[str]', jobs: int = 1,
+on_result: 'None | Callable[[RenderResult], None]' = None,
+tile_size: 'None | int' = None, cache_dir: 'None | str' = None,
+layout: bool = False, profile: bool = False, assets: 'Iterable[str]' = (),
+budget: 'None | RenderBudget' = None):
+    """ Render all given XML files, using the given number of worker
+        processes. The callback is called for every result as soon as the
+        render has finished. The tile size, cache directory, layout and profile
+        flags and the budget are passed to `render_file`. Images in the given asset
+        directories are decoded once before rendering. Returns a summary of
+        the batch """
+    summary = BatchSummary()
+    # Worker processes are forked after preloading, so they share what was
+    # loaded. Workers that are not forked preload again when starting
+    assets = list(assets)
+    preload(images=assets)
+    def handle(result: RenderResult):
+        summary.add(result)
+        if on_result is not None:
+            on_result(result)
+    if jobs <= 1:
+        for path in paths:
+            handle(render_file(path, tile_size, cache_dir, layout, profile,
+            budget))
+        summary.finish()
+        return summary
+    with ProcessPoolExecutor(max_workers=jobs, initializer=preload,
+    initargs=((), assets)) as executor:
+        # Only keep a limited number of renders queued, so very long lists of
+        # files are not all submitted at once
+        pending = set()
+        for path in paths:
+            if len(pending) >= jobs * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle(future.result())
+            pending.add(executor.submit(render_file, path, tile_size,
+            cache_dir, layout, profile, budget))
+        for future in as_completed(pending):
+            handle(future.result())
+    summary.finish()
+    return summary
@@ -0,0 +1,112 @@
+
+from typing import NamedTuple
+from PIL import Image
+import time
+from .layoutnode import LayoutNode
+
+class BudgetExceededError(Exception):
+    """ Raised when rendering a layout would use more of a resource than its
+        render budget allows. The name of the resource, the limit and the
+        actual (or estimated) use are available as attributes """
+
+    def __init__(self, resource: str, limit: float, actual: float):
+        """ Constructor, given the name of the resource, the limit and the
+            actual use """
+        super().__init__(f"Render budget exceeded for {resource}: {actual} "
+        f"is more than the limit of {limit}")
+        self.resource = resource
+        self.limit = limit
+        self.actual = actual
+
+class ResourceEstimate(NamedTuple):
+    """ An estimate of the resources needed to draw a laid out layout tree.
+        Text measurements and image decodes are upper bounds, since measured
+        text and decoded images can already be cached """
+    width: int
+    height: int
+    nodes: int
+    # Number of texts to measure and draw
+    text_measurements: int
+    # Number of different images to decode, and the bytes of the decoded and
+    # resized images
+    image_decodes: int
+    image_bytes: int
+
+    @property
+    def pixels(self):
+        """ The number of pixels of the image """
+        return self.width * self.height
+
+    @property
+    def canvas_bytes(self):
+        """ The number of bytes of the RGB image """
+        return self.pixels * 3
+
+    @classmethod
+    def of(cls, tree: LayoutNode):
+        """ Estimate the resources needed to draw a tree that has already been
+            laid out. Images are not decoded, only their headers are read """
+        nodes, texts = 0, 0
+        # Sizes that every image is drawn with
+        images: 'dict[str, set[tuple[int, int]]]' = {}
+        for node in tree.walk():
+            nodes += 1
+            if node.env["render-text"] == "true":
+                texts += 1
+            dx, dy = node.size
+            path = node.env["background-image"]
+            if path != "none" and dx >= 1 and dy >= 1:
+                images.setdefault(path, set()).add((dx, dy))
+        image_bytes = 0
+        for path, sizes in images.items():
+            try:
+                with Image.open(path) as image:
+                    bands = len(image.getbands())
+                    image_bytes += image.width * image.height * bands
+            except (OSError, Image.UnidentifiedImageError):
+                # Drawing fails on this image anyway
+                continue
+            image_bytes += sum(dx * dy * bands for dx, dy in sizes)
+        return cls(*tree.bounds(), nodes, texts, len(images), image_bytes)
+
+class RenderBudget(NamedTuple):
+    """ Limits on the resources used to render a layout, which are checked
+        before the resources are used, so renders that exceed them fail fast.
+        Limits that are None are not checked. The deadline is the maximum
+        wall-clock time of a render in seconds, which is checked between the
+        phases of rendering """
+    max_pixels: 'None | int' = None
+    max_nodes: 'None | int' = None
+    max_image_bytes: 'None | int' = None
+    deadline: 'None | float' = None
+
+    def check(self, resource: str, limit: 'None | float', actual: float):
+        """ Check the use of a resource against its limit, raising a
+            `BudgetExceededError` if it is exceeded """
+        if limit is not None and actual > limit:
+            raise BudgetExceededError(resource, limit, actual)
+
+    def check_nodes(self, tree: LayoutNode):
+        """ Check the number of nodes of a tree, which is done before laying
+            it out, since that can take long for many nodes """
+        if self.max_nodes is not None:
+            self.check("nodes", self.max_nodes, sum(1 for _ in tree.walk()))
+
+    def check_layout(self, tree: LayoutNode, start: float):
+        """ Check the deadline and the estimated resources of drawing a tree
+            that has already been laid out, before anything is drawn """
+        self.check_deadline(start)
+        self.check_estimate(ResourceEstimate.of(tree))
+        self.check_deadline(start)
+
+    def check_estimate(self, estimate: ResourceEstimate):
+        """ Check the estimated resources of a render """
+        self.check("nodes", self.max_nodes, estimate.nodes)
+        self.check("pixels", self.max_pixels, estimate.pixels)
+        self.check("image bytes", self.max_image_bytes, estimate.image_bytes)
+
+    def check_deadline(self, start: float):
+        """ Check the time passed since the given start time, as given by
+            `time.perf_counter` """
+        if self.deadline is not None:
+            self.check("seconds", self.deadline, time.perf_counter() - start)
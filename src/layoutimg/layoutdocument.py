@@ -0,0 +1,230 @@
+
+from typing import IO, NamedTuple
+from PIL import Image
+import os
+import xml.etree.ElementTree as ElementTree
+from .layoutnode import LayoutNode
+from .renderer import ImageRenderer
+from .spatialindex import SpatialIndex
+
+class _Painted(NamedTuple):
+    """ The layout of a node as it was last painted, and the areas of the
+        image it painted and needed """
+    pos: 'tuple[int, int]'
+    size: 'tuple[int, int]'
+    box: 'None | tuple[int, int, int, int]'
+    extent: 'None | tuple[int, int]'
+
+    @classmethod
+    def of(cls, node: LayoutNode):
+        """ Get the current layout of a node """
+        return cls(node.pos, node.size, node.paint_box(), node.extent())
+
+class LayoutDocument:
+    """ An XML layout that is kept in memory together with its rendered image,
+        and can be edited. After edits, `update` only lays out the parts of the
+        layout that changed, and only repaints the parts of the image that
+        changed, so the cost depends on the size of the edits instead of the
+        size of the layout. The image is always the same as rendering the
+        edited layout from scratch """
+
+    def __init__(self, text: str, cell_size: int = 256):
+        """ Constructor, with an XML string as input and the grid size of the
+            index used to find the nodes to repaint """
+        xml = ElementTree.fromstring(text)
+        if xml.tag != "image":
+            raise ValueError(f"Root tag should be image, not {xml.tag}")
+        tree = LayoutNode(xml)
+        tree.propagate_inherit()
+        self._setup(tree, cell_size)
+
+    @classmethod
+    def from_tree(cls, tree: LayoutNode, cell_size: int = 256):
+        """ Create a document from the root of an existing layout tree, which
+            is edited by the document from then on """
+        document = cls.__new__(cls)
+        document._setup(tree, cell_size)
+        return document
+
+    @property
+    def root(self):
+        """ The root node of the layout tree, which can be used to find the
+            nodes to edit """
+        return self._tree
+
+    @property
+    def renderer(self):
+        """ The renderer containing the image, which is up to date after
+            `update` has been called """
+        return self._renderer
+
+    def set_attribute(self, node: LayoutNode, name: str, value: str):
+        """ Change an attribute of a node in the layout """
+        before = {descendent: descendent.env[name]
+        for descendent in node.walk()}
+        node.set_attribute(name, value)
+        self._touched.add(node)
+        self._touched.update(descendent for descendent, old in before.items()
+        if descendent.env[name] != old)
+
+    def set_text(self, node: LayoutNode, text: str):
+        """ Change the text of a node in the layout """
+        node.set_text(text)
+        self._touched.add(node)
+
+    def insert_child(self, parent: LayoutNode, index: int, text: str):
+        """ Insert a new subtree, given as an XML string, as a child of a node
+            at the given index. Returns the root of the new subtree """
+        return parent.insert_child(index, ElementTree.fromstring(text))
+
+    def remove_child(self, node: LayoutNode):
+        """ Remove a node and its descendents from the layout """
+        if node._parent is None:
+            raise ValueError("Cannot remove the root of the layout")
+        for descendent in node.walk():
+            self._touched.discard(descendent)
+            painted = self._painted.pop(descendent, None)
+            if painted is None:
+                continue
+            if painted.box is not None:
+                self._index.remove(painted.box, descendent)
+                self._pending.append(painted.box)
+            self._check_extent(painted.extent)
+        node._parent.remove_child(node)
+
+    def update(self):
+        """ Lay out and repaint the parts of the layout changed by edits since
+            the last update. Returns the repainted areas of the image as
+            (x, y, dx, dy) """
+        laid_out: 'list[LayoutNode]' = []
+        self._tree.propagate_pos(laid_out=laid_out)
+        dirty, self._pending = self._pending, []
+        changed = self._touched.union(laid_out)
+        for node in changed:
+            old = self._painted.get(node)
+            new = _Painted.of(node)
+            if old == new and node not in self._touched:
+                continue
+            self._painted[node] = new
+            if old is not None:
+                self._check_extent(old.extent)
+                if old.box is not None:
+                    self._index.remove(old.box, node)
+                    dirty.append(old.box)
+            if new.box is not None:
+                self._index.insert(new.box, node)
+                dirty.append(new.box)
+        self._touched.clear()
+        dirty.extend(self._resize(changed))
+        areas = self._merge(dirty)
+        if areas:
+            # Nodes that were repositioned are no longer in document order in
+            # the index, so they are sorted by their position in the tree
+            order = {node: i for i, node in enumerate(self._tree.walk())}
+            for area in areas:
+                self._repaint(area, order)
+        return areas
+
+    def save(self, fp: 'str | os.PathLike[str] | IO[bytes]',
+    format: 'None | str' = None, **params):
+        """ Save the image, see `ImageRenderer.save` """
+        self._renderer.save(fp, format, **params)
+
+    def __repr__(self):
+        """ Get a debug string representation of the layout tree """
+        return self._tree.__repr__()
+
+    def _setup(self, tree: LayoutNode, cell_size: int):
+        """ Lay out and draw the layout tree of the document """
+        self._tree = tree
+        # The layout every node was last painted with
+        self._painted: 'dict[LayoutNode, _Painted]' = {}
+        self._index: 'SpatialIndex[LayoutNode]' = SpatialIndex(cell_size)
+        # Nodes that need to be repainted even if their layout is unchanged
+        self._touched: 'set[LayoutNode]' = set()
+        # Areas of the image to repaint, collected from removed nodes
+        self._pending: 'list[tuple[int, int, int, int]]' = []
+        # Whether the image might need to shrink, because a node on its edge
+        # has changed
+        self._shrink = False
+        self._tree.propagate_pos()
+        for node in self._tree.walk():
+            self._painted[node] = painted = _Painted.of(node)
+            if painted.box is not None:
+                self._index.insert(painted.box, node)
+        self._renderer = ImageRenderer(*self._tree.bounds())
+        self._tree.draw(self._renderer)
+
+    def _check_extent(self, extent: 'None | tuple[int, int]'):
+        """ Check if the image might shrink if a node with the given extent
+            changes """
+        if extent is not None and (extent[0] >= self._renderer.width or
+        extent[1] >= self._renderer.height):
+            self._shrink = True
+
+    def _resize(self, changed: 'set[LayoutNode]'):
+        """ Resize the image to the current bounds of the layout, given the
+            nodes that changed, and return the newly added areas of the image.
+            All nodes are only checked if the image might shrink """
+        old_width, old_height = self._renderer.width, self._renderer.height
+        if self._shrink:
+            extents = [painted.extent for painted in self._painted.values()]
+            self._shrink = False
+            width, height = 1, 1
+        else:
+            extents = [self._painted[node].extent for node in changed]
+            width, height = old_width, old_height
+        for extent in extents:
+            if extent is not None:
+                width, height = max(width, extent[0]), max(height, extent[1])
+        if (width, height) == (old_width, old_height):
+            return []
+        image = Image.new("RGB", (width, height), "white")
+        image.paste(self._renderer.image)
+        self._renderer = ImageRenderer.from_image(image)
+        added = []
+        if width > old_width:
+            added.append((old_width, 0, width - old_width, height))
+        if height > old_height:
+            added.append((0, old_height, min(width, old_width),
+            height - old_height))
+        return added
+
+    def _repaint(self, area: 'tuple[int, int, int, int]',
+    order: 'dict[LayoutNode, int]'):
+        """ Draw all nodes intersecting an area of the image again, given the
+            position of every node in document order, which is the order they
+            are drawn in """
+        x, y, dx, dy = area
+        region = ImageRenderer(dx, dy, origin=(x, y), expand=False)
+        nodes = self._index.query(area)
+        nodes.sort(key=order.__getitem__)
+        for node in nodes:
+            node.paint(region)
+        self._renderer.image.paste(region.image, (x, y))
+
+    def _merge(self, boxes: 'list[tuple[int, int, int, int]]'):
+        """ Clip boxes to the image and merge overlapping boxes into their
+            union, so no area is repainted twice """
+        width, height = self._renderer.width, self._renderer.height
+        merged: 'list[tuple[int, int, int, int]]' = []
+        for x, y, dx, dy in boxes:
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(width, x + dx), min(height, y + dy)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            # Keep merging until the box does not overlap any other box
+            changed = True
+            while changed:
+                changed = False
+                for other in merged:
+                    ox, oy, odx, ody = other
+                    if (ox < x1 and x0 < ox + odx and oy < y1 and
+                    y0 < oy + ody):
+                        merged.remove(other)
+                        x0, y0 = min(x0, ox), min(y0, oy)
+                        x1, y1 = max(x1, ox + odx), max(y1, oy + ody)
+                        changed = True
+                        break
+            merged.append((x0, y0, x1 - x0, y1 - y0))
+        return merged
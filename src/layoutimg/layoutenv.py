@@ -1,19 +1,119 @@
+# Default values of environment variables for every tag. These dictionaries are
+# shared between all environments and should never be modified
+_DEFAULTS: 'dict[str, dict[str, str]]' = {
+    "image": {
+        "background-color": "none",
+        "background-image": "none",
+        "flow": "none",
+        "font": "default",
+        "font-size": "64",
+        "height": "auto",
+        "max-height": "1000000",
+        "max-width": "1000000",
+        "min-height": "0",
+        "min-width": "0",
+        "render-text": "false",
+        "text-align": "left",
+        "text-color": "black",
+        "width": "auto",
+        "x": "auto",
+        "y": "auto",
+    },
+    "row": {
+        "background-color": "none",
+        "background-image": "none",
+        "flow": "y",
+        "font": "inherit",
+        "font-size": "inherit",
+        "height": "auto",
+        "max-height": "1000000",
+        "max-width": "1000000",
+        "min-height": "0",
+        "min-width": "100%",
+        "render-text": "false",
+        "text-align": "inherit",
+        "text-color": "inherit",
+        "width": "auto",
+        "x": "auto",
+        "y": "auto",
+    },
+    "col": {
+        "background-color": "none",
+        "background-image": "none",
+        "flow": "x",
+        "font": "inherit",
+        "font-size": "inherit",
+        "height": "auto",
+        "max-height": "1000000",
+        "max-width": "1000000",
+        "min-height": "100%",
+        "min-width": "0",
+        "render-text": "false",
+        "text-align": "inherit",
+        "text-color": "inherit",
+        "width": "auto",
+        "x": "auto",
+        "y": "auto",
+    },
+    "text": {
+        "background-color": "none",
+        "background-image": "none",
+        "flow": "xy",
+        "font": "inherit",
+        "font-size": "inherit",
+        "height": "auto",
+        "max-height": "1000000",
+        "max-width": "1000000",
+        "min-height": "0",
+        "min-width": "100%",
+        "render-text": "true",
+        "text-align": "inherit",
+        "text-color": "inherit",
+        "width": "auto",
+        "x": "auto",
+        "y": "auto",
+    }
+}
+# Names of environment variables that inherit their value by default, per tag
+_INHERITED = {
+    tag: tuple(name for name, value in values.items() if value == "inherit")
+    for tag, values in _DEFAULTS.items()
+}
 
 class LayoutEnv:
-    """ An environment which keeps track of  """
+    """ An environment which keeps track of the variables (attributes) of an
+        element. Only values that differ from the defaults of the tag are
+        stored per environment, the defaults are shared """
+
+    __slots__ = ("_vars", "_defaults", "_tag")
 
     def __init__(self):
         """ Constructor """
-        # Environment variables
+        # Environment variables that differ from the defaults
         self._vars: 'dict[str, str]' = {}
+        # Default values of the tag, which are shared and never modified
+        self._defaults: 'dict[str, str]' = {}
+        # The tag the default values were taken from
+        self._tag: 'None | str' = None
 
     def set_defauts(self, tag: str):
         """ Set this environment to the default values for a specific tag """
-        self._vars = self._get_defaults(tag)
+        self._defaults = self._get_defaults(tag)
+        self._tag = tag
+        self._vars = {}
+
+    def default(self, name: str):
+        """ Get the default value of an environment variable, for the tag this
+            environment was set to """
+        if self._tag is None:
+            raise RuntimeError("Cannot get default before `set_defauts`")
+        return self._defaults[name]
     
     def __getitem__(self, name: str):
         """ Get an environment variable """
-        return self._vars[name]
+        if name in self._vars:
+            return self._vars[name]
+        return self._defaults[name]
     
     def __setitem__(self, name: str, value: str):
         """ Set an environment variable """
@@ -21,95 +121,30 @@ class LayoutEnv:
 
     def __iter__(self):
         """ Iterator over environment variables """
-        yield from self._vars
+        yield from self._defaults
 
     def __contains__(self, name: str):
-        return name in self._vars
+        return name in self._defaults
+
+    def key(self):
+        """ Get a hashable value that is equal for environments with the same
+            values """
+        return self._tag, frozenset(self._vars.items())
 
     def inherit(self, parent_env: 'LayoutEnv'):
         """ Process environment inheritence by replacing all "inherit" values in
             the current environment with ones from the given parent environment
             """
-        for name in filter(lambda n: self._vars[n] == "inherit", self._vars):
+        names = [name for name in _INHERITED.get(self._tag, ())
+        if name not in self._vars]
+        names.extend(name for name, value in self._vars.items()
+        if value == "inherit")
+        for name in names:
             assert parent_env[name] != "inherit"
             self._vars[name] = parent_env[name]
 
     def _get_defaults(self, tag: str):
         """ Get the default environment variable values for a specific tag """
-        values = {
-            "image": {
-                "background-color": "none",
-                "background-image": "none",
-                "flow": "none",
-                "font": "default",
-                "font-size": "64",
-                "height": "auto",
-                "max-height": "1000000",
-                "max-width": "1000000",
-                "min-height": "0",
-                "min-width": "0",
-                "render-text": "false",
-                "text-align": "left",
-                "text-color": "black",
-                "width": "auto",
-                "x": "auto",
-                "y": "auto",
-            },
-            "row": {
-                "background-color": "none",
-                "background-image": "none",
-                "flow": "y",
-                "font": "inherit",
-                "font-size": "inherit",
-                "height": "auto",
-                "max-height": "1000000",
-                "max-width": "1000000",
-                "min-height": "0",
-                "min-width": "100%",
-                "render-text": "false",
-                "text-align": "inherit",
-                "text-color": "inherit",
-                "width": "auto",
-                "x": "auto",
-                "y": "auto",
-            },
-            "col": {
-                "background-color": "none",
-                "background-image": "none",
-                "flow": "x",
-                "font": "inherit",
-                "font-size": "inherit",
-                "height": "auto",
-                "max-height": "1000000",
-                "max-width": "1000000",
-                "min-height": "100%",
-                "min-width": "0",
-                "render-text": "false",
-                "text-align": "inherit",
-                "text-color": "inherit",
-                "width": "auto",
-                "x": "auto",
-                "y": "auto",
-            },
-            "text": {
-                "background-color": "none",
-                "background-image": "none",
-                "flow": "xy",
-                "font": "inherit",
-                "font-size": "inherit",
-                "height": "auto",
-                "max-height": "1000000",
-                "max-width": "1000000",
-                "min-height": "0",
-                "min-width": "100%",
-                "render-text": "true",
-                "text-align": "inherit",
-                "text-color": "inherit",
-                "width": "auto",
-                "x": "auto",
-                "y": "auto",
-            }
-        }
-        if tag not in values:
+        if tag not in _DEFAULTS:
             raise ValueError(f"Tag {tag} is not allowed")
-        return values[tag]
+        return _DEFAULTS[tag]
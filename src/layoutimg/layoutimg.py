@@ -1,40 +1,215 @@
 
-from .renderer import ImageRenderer
+from contextlib import contextmanager
+from typing import IO
+from PIL import Image
+import json
+import os
+import shutil
+import time
+from .renderer import ImageRenderer, font_cache, image_cache, text_metrics
 import xml.etree.ElementTree as ElementTree
+from .asyncrender import RenderExecutor, render_executor
+from .budget import RenderBudget, ResourceEstimate
 from .layoutnode import LayoutNode
+from .occlusion import OcclusionCuller
+from .profiling import Tracer, null_tracer
+from .rendercache import RenderCache
+from .sprites import SpriteRenderer
+from .tiling import TiledRenderer
 
 class LayoutImage:
-    """ An XML to image converter, using some basic tags and attributes """
+    """ An XML to image converter, using some basic tags and attributes.
+        Different layout images can be generated from different threads at
+        the same time """
 
-    def __init__(self, text: str):
-        """ Constructor, with an XML string as input """
+    def __init__(self, text: str, *, tracer: 'None | Tracer' = None):
+        """ Constructor, with an XML string as input. A tracer can be given
+            to profile the phases of rendering """
+        self._tracer = null_tracer if tracer is None else tracer
         # The renderer used to create the image. Is only created when `generate`
         # is called
         self._renderer: 'None | ImageRenderer' = None
-        self._text = text
-        self._xml = self._parse_xml()
+        # Path of the PNG file in a render cache containing the generated
+        # image, if a render cache was used
+        self._cached: 'None | str' = None
+        # Budget of the last generated image, used when the image has to be
+        # generated again since it was removed from the render cache
+        self._budget: 'None | RenderBudget' = None
+        self._text: 'None | str' = text
+        self._xml: 'None | ElementTree.Element' = self._parse_xml()
         self._tree: 'None | LayoutNode' = None
         if self._xml.tag != "image":
             raise ValueError(f"Root tag should be image, not {self._xml.tag}")
 
-    def generate(self):
-        """ Generate the image for the stored XML """
-        self._renderer = ImageRenderer()
-        self._tree = LayoutNode(self._xml)
-        self._tree.propagate_inherit()
-        self._tree.propagate_pos()
-        self._tree.draw(self._renderer)
+    @classmethod
+    def from_file(cls, filename: str, *, tracer: 'None | Tracer' = None):
+        """ Create a layout image from an XML file with the given filename. The
+            file is parsed incrementally, see `from_stream` """
+        with open(filename, "rb") as input_file:
+            return cls.from_stream(input_file, tracer=tracer)
 
-    def save(self, filename: str):
-        """ Save the generated image to a file with the given filename, as a PNG
+    @classmethod
+    def from_stream(cls, stream: 'IO[bytes]', *,
+    tracer: 'None | Tracer' = None):
+        """ Create a layout image from a file object containing XML. The XML is
+            parsed incrementally and the layout tree is built while parsing,
+            without keeping the XML tree in memory. This is useful for very
+            large layouts """
+        image = cls.__new__(cls)
+        image._tracer = null_tracer if tracer is None else tracer
+        image._renderer = None
+        image._cached = None
+        image._text = None
+        image._xml = None
+        with image._tracer.phase("parse"):
+            image._tree = LayoutNode.parse(stream)
+        if image._tree.tag != "image":
+            raise ValueError(f"Root tag should be image, not {image._tree.tag}")
+        with image._tracer.phase("inherit"):
+            image._tree.propagate_inherit()
+        return image
+
+    def generate(self, threads: int = 1, tile_size: int = 256,
+    cache: 'None | RenderCache' = None, sprites: bool = True,
+    cull: bool = True, budget: 'None | RenderBudget' = None):
+        """ Generate the image for the stored XML. The size of the image is
+            determined from the layout before drawing, so the image does not
+            need to be expanded while drawing. With more than one thread, the
+            image is drawn as tiles of the given size on a thread pool, which
+            gives exactly the same image. Otherwise, repeated subtrees are
+            drawn once and copied, unless sprites is false (see
+            `SpriteRenderer`), and backgrounds that are painted over are
+            skipped, unless cull is false (see `OcclusionCuller`). If a render
+            cache is given, a cached
+            image of the same XML is used instead of rendering, and a new image
+            is stored in the cache. Images created from a stream are never
+            cached. If a budget is given, the resources needed are estimated
+            after the layout is determined, and a `BudgetExceededError` is
+            raised before drawing if the budget would be exceeded """
+        start = time.perf_counter()
+        self._renderer = None
+        self._cached = None
+        self._budget = budget
+        key = None
+        if cache is not None and self._text is not None:
+            key = cache.key(self._text, self._xml)
+            self._cached = cache.get(key)
+            if self._cached is not None:
+                return
+        with self._count_cache_misses():
+            self._layout(budget, start)
+            with self._tracer.phase("draw"):
+                if threads > 1:
+                    self._renderer = TiledRenderer(self._tree, tile_size,
+                    self._tracer).render(threads)
+                else:
+                    self._renderer = ImageRenderer(*self._tree.bounds(),
+                    tracer=self._tracer)
+                    covered = self._cull() if cull else {}
+                    if sprites:
+                        SpriteRenderer(self._tree, covered=covered).draw(
+                        self._renderer)
+                    else:
+                        self._tree.draw(self._renderer, covered)
+        if key is not None:
+            self._cached = cache.put(key, self._renderer.to_bytes())
+
+    async def agenerate(self, executor: 'None | RenderExecutor' = None,
+    **kwargs):
+        """ Generate the image like `generate`, with the same keyword
+            arguments, without blocking the event loop. The work is done by the
+            given render executor, or by `render_executor` by default """
+        executor = render_executor if executor is None else executor
+        await executor.run(self.generate, **kwargs)
+
+    async def arender_to_bytes(self, format: str = "PNG",
+    executor: 'None | RenderExecutor' = None, **params):
+        """ Generate the image and encode it like `to_bytes`, without
+            blocking the event loop. Both are done as a single job by the given
+            render executor, or by `render_executor` by default """
+        executor = render_executor if executor is None else executor
+        def render():
+            self.generate()
+            return self.to_bytes(format, **params)
+        return await executor.run(render)
+
+    def layout(self):
+        """ Determine the layout of the stored XML without drawing anything,
+            and return the boxes of all elements in document order. Text is
+            only measured, so this is much cheaper than `generate` """
+        with self._count_cache_misses():
+            self._layout()
+        return list(self._tree.boxes())
+
+    def estimate(self):
+        """ Determine the layout of the stored XML without drawing anything,
+            and estimate the resources needed to draw it, see
+            `ResourceEstimate` """
+        with self._count_cache_misses():
+            self._layout()
+        return ResourceEstimate.of(self._tree)
+
+    def layout_json(self, indent: 'None | int' = None):
+        """ Determine the layout of the stored XML, and return the boxes of
+            all elements as a JSON array of objects """
+        return json.dumps([box._asdict() for box in self.layout()],
+        indent=indent)
+
+    def save_tiled(self, fp: 'str | os.PathLike[str] | IO[bytes]',
+    tile_size: int = 256, budget: 'None | RenderBudget' = None):
+        """ Generate the image and save it as a PNG to a file with the given
+            filename or to a binary file object, drawing it in tiles of the
+            given size. Only one band of tiles is in memory at a time, instead
+            of the whole image. This does not require `generate` to be called
+            first. The budget is checked like in `generate` """
+        with self._count_cache_misses():
+            self._layout(budget, time.perf_counter())
+            with self._tracer.phase("draw"):
+                TiledRenderer(self._tree, tile_size, self._tracer).save(fp)
+
+    def save(self, fp: 'str | os.PathLike[str] | IO[bytes]',
+    format: 'None | str' = None, **params):
+        """ Save the generated image to a file with the given filename, or to a
+            binary file object. The format and encoder options are the same as
+            for `ImageRenderer.save`, and default to PNG. A default PNG of an
+            image in a render cache is copied from the cache """
+        if isinstance(fp, os.PathLike):
+            fp = os.fspath(fp)
+        if self._is_cached_png(fp, format, params):
+            cached_file = self._open_cached()
+            if cached_file is not None:
+                with cached_file:
+                    if isinstance(fp, str):
+                        with open(fp, "wb") as output:
+                            shutil.copyfileobj(cached_file, output)
+                    else:
+                        shutil.copyfileobj(cached_file, fp)
+                return
+        self._get_renderer("save").save(fp, format, **params)
+
+    def to_bytes(self, format: str = "PNG", **params):
+        """ Get the generated image encoded as bytes, by default as a PNG. The
+            encoder options are the same as for `ImageRenderer.save` """
+        if self._is_cached_png(None, format, params):
+            cached_file = self._open_cached()
+            if cached_file is not None:
+                with cached_file:
+                    return cached_file.read()
+        return self._get_renderer("to_bytes").to_bytes(format, **params)
+
+    def to_buffer(self):
+        """ Get the raw RGB pixel data of the generated image as a memoryview
             """
-        if self._renderer is None:
-            raise RuntimeError("Cannot call `save` before `generate`")
-        self._renderer.save(filename)
+        return self._get_renderer("to_buffer").to_buffer()
 
     def __eq__(self, other: object):
         """ Check if two layout images are the same """
-        return self.__class__ == other.__class__ and self._xml == other._xml
+        if self.__class__ != other.__class__:
+            return False
+        if self._xml is None or other._xml is None:
+            # Images read from a stream have no XML tree to compare
+            return self is other
+        return self._xml == other._xml
 
     def __repr__(self):
         """ Get a debug string representation of the layout tree """
@@ -42,6 +217,90 @@ class LayoutImage:
             return "LayoutImage"
         return self._tree.__repr__()
 
+    def _get_renderer(self, action: str):
+        """ Get the renderer containing the generated image, loading it from
+            the render cache if needed. The name of the action that needs the
+            renderer is used in the error if nothing was generated yet """
+        if self._renderer is None and self._cached is not None:
+            cached_file = self._open_cached()
+            if cached_file is not None:
+                with cached_file, Image.open(cached_file) as cached_image:
+                    self._renderer = ImageRenderer.from_image(
+                    cached_image.convert("RGB"), tracer=self._tracer)
+        if self._renderer is None:
+            raise RuntimeError(f"Cannot call `{action}` before `generate`")
+        return self._renderer
+
+    def _open_cached(self):
+        """ Open the PNG file of the image in the render cache. If another
+            process removed it from the cache, the image is generated again
+            without the cache and None is returned """
+        try:
+            return open(self._cached, "rb")
+        except FileNotFoundError:
+            self.generate(budget=self._budget)
+            return None
+
+    def _is_cached_png(self, fp: 'None | str | IO[bytes]',
+    format: 'None | str', params: dict):
+        """ Check if saving with the given arguments gives exactly the PNG file
+            stored in the render cache """
+        if self._cached is None or params:
+            return False
+        if format is None:
+            return not isinstance(fp, str) or fp.lower().endswith(".png")
+        return format.upper() == "PNG"
+
+    def _cull(self):
+        """ Find the nodes whose backgrounds are painted over, and count them
+            with the tracer """
+        with self._tracer.phase("cull"):
+            culler = OcclusionCuller(self._tree)
+        self._tracer.count("culled backgrounds", len(culler.covered))
+        self._tracer.count("culled pixels", culler.skipped_pixels)
+        return culler.covered
+
+    @contextmanager
+    def _count_cache_misses(self):
+        """ Context manager that counts the text measurements, font loads and
+            image decodes done inside it, using the misses of the shared caches.
+            Work done by other threads at the same time is counted as well """
+        if not self._tracer.enabled:
+            yield
+            return
+        caches = {"text measurements": text_metrics, "font loads": font_cache,
+        "image decodes": image_cache}
+        before = {name: cache.stats()["misses"] for name, cache in caches.items()}
+        try:
+            yield
+        finally:
+            for name, cache in caches.items():
+                self._tracer.count(name, cache.stats()["misses"] - before[name])
+
+    def _layout(self, budget: 'None | RenderBudget' = None,
+    start: float = 0.0):
+        """ Build the layout tree if needed, and determine the sizes and
+            positions of all nodes. If a budget is given, the number of nodes
+            is checked before determining the layout, which can take long for
+            many nodes, and the deadline (measured from the given start time)
+            and estimated resources are checked after """
+        if self._xml is not None:
+            with self._tracer.phase("build"):
+                self._tree = LayoutNode(self._xml)
+            with self._tracer.phase("inherit"):
+                self._tree.propagate_inherit()
+        assert self._tree is not None
+        if budget is not None:
+            budget.check_nodes(self._tree)
+        with self._tracer.phase("layout"):
+            self._tree.propagate_pos()
+        if self._tracer.enabled:
+            self._tracer.count("nodes", sum(1 for _ in self._tree.walk()))
+        if budget is not None:
+            with self._tracer.phase("preflight"):
+                budget.check_layout(self._tree, start)
+
     def _parse_xml(self):
         """ Parse the stored XML text and return the generated element tree """
-        return ElementTree.fromstring(self._text)
\ No newline at end of file
+        with self._tracer.phase("parse"):
+            return ElementTree.fromstring(self._text)
\ No newline at end of file
@@ -1,94 +1,360 @@
 
-from typing import Literal
-from xml.etree.ElementTree import Element
+from functools import lru_cache
+from typing import IO, Container, Literal, Mapping, NamedTuple
+from xml.etree.ElementTree import Element, iterparse
 from .layoutenv import LayoutEnv
-from .renderer import ImageRenderer
+from .renderer import ImageRenderer, text_metrics
 import math
 
-# A renderer only used to get the bounding box of some text
-_bbox_renderer = ImageRenderer()
+# Environment variables that only affect how a node is painted, not its size
+# or position
+_PAINT_ONLY = ("background-color", "background-image", "text-color")
+
+@lru_cache(maxsize=1024)
+def _parse_length(value: str):
+    """ Parse a percentage or fixed value once, returned as a tuple of the
+        proportion or pixel count and whether it is a percentage """
+    if value.endswith("%"):
+        return float(value[:-1]) / 100, True
+    return int(value), False
+
+def _parse_pixels(value: str):
+    """ Parse a fixed pixel value once, which cannot be a percentage """
+    number, percentage = _parse_length(value)
+    if percentage:
+        raise ValueError(f"Value should be a number of pixels, not "
+        f"\"{value}\"")
+    return number
+
+def _replace(pair: 'tuple[int, int]', index: int, value: int):
+    """ Get a copy of a pair with the value at the given index replaced """
+    return (value, pair[1]) if index == 0 else (pair[0], value)
+
+class LayoutError(Exception):
+    """ Raised when a layout is invalid, such as when it uses an attribute
+        that does not exist or a template value is missing. Unlike other
+        errors, these are caused by the layout and not by a bug """
+
+class InvalidAttributeError(LayoutError, AttributeError):
+    """ Raised when a layout uses an attribute that does not exist """
+
+class LayoutBox(NamedTuple):
+    """ The position and size of a node after layout, and its depth in the
+        layout tree """
+    tag: str
+    x: int
+    y: int
+    width: int
+    height: int
+    depth: int
 
 class LayoutNode:
     """ A node which represents an XML tag in the XML source text. It contains
-        a reference to the original node, as well as environment and dimension
-        information """
+        the tag, attributes and text of the original node, as well as
+        environment and dimension information. It does not keep a reference to
+        the XML element it was created from """
+
+    __slots__ = ("_parent", "tag", "attrib", "text", "env", "children",
+    "size", "pos", "_dirty", "_layout_key")
     
     def __init__(self, node: Element, parent: 'None | LayoutNode' = None):
         """ Constructor, from an XML element node and the parent layout node.
             This automatically creates a tree of layout nodes, where children
             have a link to their parent """
+        self._setup(node.tag, node.attrib, node.text, parent)
+        # Build the tree without recursion, so depth is not limited by the
+        # recursion limit
+        stack = [(self, node)]
+        while stack:
+            current, element = stack.pop()
+            for child_element in element:
+                child = LayoutNode._create(child_element.tag,
+                child_element.attrib, child_element.text, current)
+                stack.append((child, child_element))
+
+    @classmethod
+    def parse(cls, source: 'str | IO[bytes]'):
+        """ Create a tree of layout nodes from an XML file, given by its file
+            name or as a file object. The XML is parsed incrementally, and
+            every XML element is released as soon as its attributes and text
+            have been stored, so the whole XML tree is never kept in memory.
+            Returns the root layout node """
+        root: 'None | LayoutNode' = None
+        nodes: 'list[LayoutNode]' = []
+        elements: 'list[Element]' = []
+        for event, element in iterparse(source, events=("start", "end")):
+            if event == "start":
+                parent = nodes[-1] if nodes else None
+                nodes.append(cls._create(element.tag, element.attrib, None,
+                parent))
+                elements.append(element)
+                continue
+            node = nodes.pop()
+            elements.pop()
+            node.text = "" if element.text is None else element.text
+            element.clear()
+            if elements:
+                # The element that just ended is always the last child
+                del elements[-1][-1]
+            else:
+                root = node
+        assert root is not None
+        return root
+
+    @classmethod
+    def _create(cls, tag: str, attrib: 'Mapping[str, str]',
+    text: 'None | str', parent: 'None | LayoutNode'):
+        """ Create a single layout node, without any children, and add it to
+            the children of its parent """
+        node = cls.__new__(cls)
+        node._setup(tag, attrib, text, parent)
+        if parent is not None:
+            parent.children.append(node)
+        return node
+
+    def _setup(self, tag: str, attrib: 'Mapping[str, str]',
+    text: 'None | str', parent: 'None | LayoutNode'):
+        """ Initialize this layout node from the tag, attributes and text of an
+            XML element node and the parent layout node, without any children
+            """
         self._parent = parent
-        self.node = node
+        self.tag = tag
+        # Attributes and text of the node, which can be edited after creation
+        self.attrib = dict(attrib)
+        self.text = "" if text is None else text
         self.env = LayoutEnv()
-        self.env.set_defauts(node.tag)
+        self.env.set_defauts(tag)
         self._process_attributes()
-        self.children = [LayoutNode(child, self) for child in self.node]
+        self.children: 'list[LayoutNode]' = []
         self.size: 'tuple[int, int]' = (0, 0)
         self.pos: 'tuple[int, int]' = (-1, -1)
+        # Whether the layout of this node or a descendent has changed since the
+        # last call to `propagate_pos`, and the arguments of that call
+        self._dirty = True
+        self._layout_key: 'None | tuple' = None
     
     def __iter__(self):
         """ Iterator over children """
         yield from self.children
 
+    def walk(self):
+        """ Iterator over this node and all its descendents, in document order
+            (which is also the order they are drawn in) """
+        for node, _ in self._walk_depth():
+            yield node
+
+    def boxes(self):
+        """ Iterator over the boxes of this node and all its descendents in
+            document order, with depths relative to this node. Should be called
+            after `propagate_pos` """
+        for node, depth in self._walk_depth():
+            yield LayoutBox(node.tag, *node.pos, *node.size, depth)
+
     def propagate_inherit(self):
         """ Replace all "inherit" values in environments in the tree """
-        if self._parent is not None:
-            self.env.inherit(self._parent.env)
-        for child in self:
-            child.propagate_inherit()
+        for node in self.walk():
+            if node._parent is not None:
+                node.env.inherit(node._parent.env)
 
-    def propagate_pos(self, pos: 'tuple[int, int]' = (0, 0)):
+    def propagate_pos(self, pos: 'tuple[int, int]' = (0, 0),
+    laid_out: 'None | list[LayoutNode]' = None):
         """ Determine size and position of this node and all child nodes, given
-            the current position """
-        self.pos = pos
-        self._set_custom_pos()
-        pos = self.pos
-        for dim in ("width", "height"):
-            self._edit_size_before_children(dim)
-        for child in self:
-            child.propagate_pos(pos)
-            # Update current position
-            if child.env["flow"] == "none":
+            the current position. Subtrees that have not changed since the
+            last call, and are positioned the same way, are skipped. If a list
+            is given, all nodes whose layout was recomputed are appended to it
+            """
+        frame = self._begin_layout(pos)
+        if frame is None:
+            return
+        if laid_out is not None:
+            laid_out.append(self)
+        # Stack of nodes being laid out, as lists of the node, the layout key,
+        # the index of the next child and the current position for children
+        stack = [frame]
+        while stack:
+            frame = stack[-1]
+            node, key, index, pos = frame
+            if index < len(node.children):
+                child = node.children[index]
+                frame[2] = index + 1
+                child_frame = child._begin_layout(pos)
+                if child_frame is not None:
+                    stack.append(child_frame)
+                    if laid_out is not None:
+                        laid_out.append(child)
+                else:
+                    frame[3] = child._advance(pos)
                 continue
-            assert child.env["flow"] in ("x", "y", "xy")
-            if "x" in child.env["flow"]:
-                pos = (max(pos[0], child.pos[0] + child.size[0]), pos[1])
-            if "y" in child.env["flow"]:
-                pos = (pos[0], max(pos[1], child.pos[1] + child.size[1]))
-        for dim in ("width", "height"):
-            self._edit_size_after_children(dim)
+            node._end_layout(key)
+            stack.pop()
+            if stack:
+                stack[-1][3] = node._advance(stack[-1][3])
+
+    def set_attribute(self, name: str, value: str):
+        """ Change an attribute of this node. The environment of this node and
+            of descendents inheriting the attribute is updated, and the layout
+            is marked as changed if needed """
+        if name not in self.env:
+            raise InvalidAttributeError(f"The attribute {name} is not valid")
+        if self.attrib.get(name) == value:
+            return
+        self.attrib[name] = value
+        self._update_env(name)
+
+    def set_text(self, text: str):
+        """ Change the text of this node """
+        if self.text == text:
+            return
+        self.text = text
+        self.mark_dirty()
+
+    def insert_child(self, index: int, element: Element):
+        """ Create a subtree of layout nodes from an XML element and insert it
+            as a child of this node at the given index. Returns the root of the
+            new subtree """
+        child = LayoutNode(element, self)
+        self.children.insert(index, child)
+        child.propagate_inherit()
+        self.mark_dirty()
+        return child
 
-    def draw(self, renderer: ImageRenderer):
+    def remove_child(self, child: 'LayoutNode'):
+        """ Remove a child (and so its descendents) from this node """
+        self.children.remove(child)
+        child._parent = None
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        """ Mark the layout of this node, and so of its ancestors, as changed,
+            so it is recomputed by the next call to `propagate_pos` """
+        node = self
+        while node is not None and not node._dirty:
+            node._dirty = True
+            node = node._parent
+
+    def draw(self, renderer: ImageRenderer,
+    covered: 'Container[LayoutNode]' = ()):
         """ Draw the current layout node and its descendents to the given
-            renderer """
+            renderer. The backgrounds of the given covered nodes are skipped,
+            see `OcclusionCuller` """
+        for node in self.walk():
+            node.paint(renderer, node not in covered)
+
+    def paint(self, renderer: ImageRenderer, background: bool = True):
+        """ Draw only the current layout node, without its descendents, to the
+            given renderer. Drawing the background color and image can be
+            skipped, for example if it is painted over later anyway """
         # Expand image to include element
         renderer.expand_image(*self.pos, *self.size)
         # Background color
-        if self.env["background-color"] != "none":
+        if background and self.env["background-color"] != "none":
             renderer.draw_rect(*self.pos, *self.size,
             color=self.env["background-color"])
         # Background image
-        if self.env["background-image"] != "none":
+        if background and self.env["background-image"] != "none":
             renderer.draw_image(*self.pos, *self.size,
             self.env["background-image"])
         # Rendering text
         if self.env["render-text"] == "true":
             self._draw_text(renderer)
-        for child in self:
-            child.draw(renderer)
+
+    def paint_box(self):
+        """ Get the box containing all pixels that `paint` can change, as
+            (x, y, dx, dy), or None if painting this node changes nothing """
+        boxes = []
+        if self.env["background-color"] != "none":
+            # Rectangles include their right and bottom edge
+            boxes.append((*self.pos, self.size[0] + 1, self.size[1] + 1))
+        if self.env["background-image"] != "none":
+            boxes.append((*self.pos, *self.size))
+        if self.env["render-text"] == "true":
+            boxes.append(self._text_bbox())
+        boxes = [box for box in boxes if box[2] >= 1 and box[3] >= 1]
+        if not boxes:
+            return None
+        x0 = min(box[0] for box in boxes)
+        y0 = min(box[1] for box in boxes)
+        x1 = max(box[0] + box[2] for box in boxes)
+        y1 = max(box[1] + box[3] for box in boxes)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def extent(self):
+        """ Get the bottom right corner of the part of the image this node
+            needs, not including its descendents, as (x, y). This includes the
+            bounding box of text. Returns None if the node is empty """
+        boxes = [(*self.pos, *self.size)]
+        if self.env["render-text"] == "true":
+            boxes.append(self._text_bbox())
+        corners = [(x + dx, y + dy) for x, y, dx, dy in boxes
+        if dx >= 1 and dy >= 1]
+        if not corners:
+            return None
+        return max(x for x, _ in corners), max(y for _, y in corners)
+
+    def bounds(self):
+        """ Get the size of the image needed to draw this node and its
+            descendents, as (width, height). This includes the bounding boxes
+            of text, and is never smaller than 1x1 """
+        width, height = 1, 1
+        for node in self.walk():
+            extent = node.extent()
+            if extent is not None:
+                width, height = max(width, extent[0]), max(height, extent[1])
+        return width, height
 
     def __repr__(self):
         """ Get a debug representation of the layout tree """
         return self._debug_string()
     
-    def _debug_string(self, depth: int = 0):
-        """ Get a debug representation of the layout tree, given the current
-            depth of the node """
-        text = "| " * depth
-        text += f"<{self.node.tag}> pos={self.pos} size={self.size}\n"
-        for child in self:
-            text += child._debug_string(depth + 1)
-        return text
+    def _debug_string(self):
+        """ Get a debug representation of the layout tree """
+        return "".join(f"{'| ' * depth}<{node.tag}> pos={node.pos} "
+        f"size={node.size}\n" for node, depth in self._walk_depth())
+
+    def _walk_depth(self):
+        """ Iterator over this node and all its descendents in document order,
+            as tuples of the node and its depth relative to this node """
+        stack: 'list[tuple[LayoutNode, int]]' = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            stack.extend((child, depth + 1) for child in reversed(node.children))
+
+    def _begin_layout(self, pos: 'tuple[int, int]'):
+        """ Start determining the size and position of this node, before its
+            children are laid out. Returns None if the node has not changed
+            since the last layout, and otherwise the layout stack frame """
+        parent_size = None if self._parent is None else self._parent.size
+        key = (pos, parent_size)
+        if not self._dirty and key == self._layout_key:
+            return None
+        self.size = (0, 0)
+        self.pos = pos
+        self._set_custom_pos()
+        for dim in ("width", "height"):
+            self._edit_size_before_children(dim)
+        return [self, key, 0, self.pos]
+
+    def _end_layout(self, key: tuple):
+        """ Finish determining the size of this node, after its children have
+            been laid out """
+        for dim in ("width", "height"):
+            self._edit_size_after_children(dim)
+        self._layout_key = key
+        self._dirty = False
+
+    def _advance(self, pos: 'tuple[int, int]'):
+        """ Get the position for the next sibling of this node, given the
+            position this node was placed at by its parent """
+        flow = self.env["flow"]
+        if flow == "none":
+            return pos
+        assert flow in ("x", "y", "xy")
+        if "x" in flow:
+            pos = (max(pos[0], self.pos[0] + self.size[0]), pos[1])
+        if "y" in flow:
+            pos = (pos[0], max(pos[1], self.pos[1] + self.size[1]))
+        return pos
 
     def _set_custom_pos(self):
         """ If one or both attributes x and y are given, apply these values to
@@ -96,23 +362,20 @@ class LayoutNode:
         for attr, index in (("x", 0), ("y", 1)):
             if self.env[attr] == "auto":
                 continue
-            value = int(self.env[attr])
-            new_pos = list(self.pos)
-            new_pos[index] = value
-            self.pos = tuple(new_pos)
+            value = _parse_pixels(self.env[attr])
+            self.pos = _replace(self.pos, index, value)
 
     def _edit_size_before_children(self, name: 'Literal["width", "height"]'):
         """ Modify self.size based on the size, without considering "auto".
             Given as an argument is whether the width or height should be edited
             """
         index = 0 if name == "width" else 1
-        size = list(self.size)
         if self.env[name] == "auto":
             self._clamp_size(name)
             return
         parent_size = 0 if self._parent is None else self._parent.size[index]
-        size[index] = self._value_to_pixels(self.env[name], parent_size)
-        self.size = tuple(size)
+        self.size = _replace(self.size, index,
+        self._value_to_pixels(self.env[name], parent_size))
         self._clamp_size(name)
 
     def _edit_size_after_children(self, name: 'Literal["width", "height"]'):
@@ -120,7 +383,6 @@ class LayoutNode:
             using child sizes. Given as an argument is whether the width or
             height should be edited """
         index = 0 if name == "width" else 1
-        size = list(self.size)
         if self.env[name] != "auto":
             return
         assert self.env["render-text"] in ("true", "false")
@@ -128,58 +390,83 @@ class LayoutNode:
             self._edit_size_text(name)
             self._clamp_size(name)
             return
-        for child in self:
-            size[index] = max(size[index], child.pos[index] + child.size[index]
+        value = self.size[index]
+        for child in self.children:
+            value = max(value, child.pos[index] + child.size[index]
             - self.pos[index])
-        self.size = tuple(size)
+        self.size = _replace(self.size, index, value)
         self._clamp_size(name)
 
     def _clamp_size(self, name: 'Literal["width", "height"]'):
         """ Clamp the width and height of the element to the min and max values
             in the environment """
         index = 0 if name == "width" else 1
-        def clamp(val: int, mn: int, mx: int):
-            return max(mn, min(val, mx))
-        size = list(self.size)
         parent_size = 0 if self._parent is None else self._parent.size[index]
         mn = self._value_to_pixels(self.env[f"min-{name}"], parent_size)
         mx = self._value_to_pixels(self.env[f"max-{name}"], parent_size)
-        size[index] = clamp(size[index], mn, mx)
-        self.size = tuple(size)
+        self.size = _replace(self.size, index, max(mn, min(self.size[index],
+        mx)))
 
     def _value_to_pixels(self, value: str, relative: int):
         """ Convert a percentage or fixed value to a pixel count integer. The
             relative size of the parent should be given for the case that the
-            value is a percentage """
-        if value.endswith("%"):
-            # Pecentages
-            prop = float(value[:-1]) / 100
-            return int(prop * relative)
-        # Raw numbers
-        return int(value)
+            value is a percentage. Parsed values are cached """
+        number, percentage = _parse_length(value)
+        if percentage:
+            return int(number * relative)
+        return number
 
     def _edit_size_text(self, name: 'Literal["width", "height"]'):
         """ Modify self.size based on the size of the text contained in this
             element. This function should only be called if the variable has
             "auto" as a value """
-        size = list(self.size)
         if name == "width":
-            size[0] = max(size[0], self._text_dims()[0])
+            self.size = (max(self.size[0], self._text_dims()[0]), self.size[1])
         else:
-            size[1] = max(size[1], self._font_height)
-        self.size = tuple(size)
+            self.size = (self.size[0], max(self.size[1], self._font_height))
+
+    def _update_env(self, name: str):
+        """ Recompute an environment variable from the attributes of this node
+            and the environment of the parent, and do the same for descendents
+            whose value changes as a result """
+        stack: 'list[LayoutNode]' = [self]
+        while stack:
+            node = stack.pop()
+            value = node.attrib.get(name, node.env.default(name))
+            if value == "inherit" and node._parent is not None:
+                value = node._parent.env[name]
+            if node.env[name] == value:
+                continue
+            node.env[name] = value
+            if name not in _PAINT_ONLY:
+                node.mark_dirty()
+            stack.extend(node.children)
 
     def _process_attributes(self):
         """ Process the attributes of the XML node and set them as environment
             variables """
-        for name, value in self.node.attrib.items():
+        for name, value in self.attrib.items():
             if name not in self.env:
-                raise AttributeError(f"The attribute {name} is not valid")
+                raise InvalidAttributeError(f"The attribute {name} is not valid")
             self.env[name] = value
 
     def _draw_text(self, renderer: ImageRenderer):
         """ Render text in this node to the given renderer. Returns the bounding
             box of the text as (x, y, dx, dy) """
+        x, y = self._text_pos()
+        bbox = renderer.draw_text(
+            x = x,
+            y = y,
+            text = self._text,
+            font = None if self.env["font"] == "default" else self.env["font"],
+            font_size = self._font_size,
+            color = self.env["text-color"]
+        )
+        return bbox
+    
+    def _text_pos(self):
+        """ Get the position to draw the text in this element at, taking into
+            account the text alignment """
         text_width = self._text_dims()[0]
         align = self.env["text-align"]
         if align not in ("left", "center", "right"):
@@ -189,32 +476,37 @@ class LayoutNode:
             "center": max(0, self.size[0] - text_width) // 2,
             "right": max(0, self.size[0] - text_width),
         }[align]
-        bbox = renderer.draw_text(
-            x = self.pos[0] + left_pad,
-            y = self.pos[1],
-            text = self._text,
-            font = None if self.env["font"] == "default" else self.env["font"],
-            font_size = int(self.env["font-size"]),
-            color = self.env["text-color"]
-        )
-        return bbox
-    
+        return self.pos[0] + left_pad, self.pos[1]
+
+    def _text_bbox(self):
+        """ Get the bounding box of the text in this element as it would be
+            drawn, as (x, y, dx, dy) """
+        x, y = self._text_pos()
+        bbox = self._text_measure().bbox
+        return x + bbox[0], y + bbox[1], bbox[2], bbox[3]
+
     def _text_dims(self):
         """ Get the dimensions of the text in the element being drawn """
-        bbox = _bbox_renderer.draw_text(0, 0, self._text,
+        return self._text_measure().bbox[2:]
+
+    def _text_measure(self):
+        """ Get the measurements of the text in this element """
+        return text_metrics.measure(self._text,
             font = None if self.env["font"] == "default" else self.env["font"],
-            font_size = int(self.env["font-size"]),
-            color = self.env["text-color"],
-            only_bbox = True
+            font_size = self._font_size
         )
-        return bbox[2:]
     
+    @property
+    def _font_size(self):
+        """ The font size in this element in pixels """
+        return _parse_pixels(self.env["font-size"])
+
     @property
     def _font_height(self):
         """ The font height in this element, which is larger than font size """
-        return int(int(self.env["font-size"]) * 1.35)
+        return int(self._font_size * 1.35)
     
     @property
     def _text(self):
         """ The text to be displayed in this element """
-        return "" if self.node.text is None else self.node.text
+        return self.text
@@ -0,0 +1,193 @@
+
+from string import Template
+from typing import IO, Iterable, Mapping, NamedTuple, Sized
+from PIL import Image
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+from .budget import RenderBudget
+from .layoutdocument import LayoutDocument
+from .layoutnode import LayoutError, LayoutNode
+from .renderer import ImageRenderer
+from .renderer.pngwriter import APNGWriter
+
+class MissingValueError(LayoutError, KeyError):
+    """ Raised when the data of a template has no value for a placeholder """
+
+def _fill(template: Template, data: 'Mapping[str, object]'):
+    """ Substitute the values in the given data into a template """
+    try:
+        return template.substitute(data)
+    except KeyError as error:
+        message = f"No value for placeholder {error.args[0]}"
+        raise MissingValueError(message) from None
+
+class Frame(NamedTuple):
+    """ A frame of an animation, with the areas of the image that changed
+        since the previous frame as (x, y, dx, dy). For the first frame this is
+        the whole image """
+    image: Image.Image
+    areas: 'list[tuple[int, int, int, int]]'
+
+class LayoutTemplate:
+    """ An XML layout with placeholders in text and attribute values, which is
+        parsed once and can be rendered many times with different data.
+        Placeholders use the `string.Template` syntax, so `$name` or `${name}`,
+        with `$$` for a literal dollar sign """
+
+    def __init__(self, text: str):
+        """ Constructor, with an XML string as input """
+        self._xml = ElementTree.fromstring(text)
+        if self._xml.tag != "image":
+            raise ValueError(f"Root tag should be image, not {self._xml.tag}")
+        self._tree = LayoutNode(self._xml)
+        self._tree.propagate_inherit()
+        # Text and attribute values containing placeholders, as tuples of the
+        # node, the attribute name (None for text) and the template
+        self._fields: 'list[tuple[LayoutNode, None | str, Template]]' = []
+        self._find_fields()
+
+    @property
+    def placeholders(self):
+        """ The names of all placeholders used in the template """
+        names: 'set[str]' = set()
+        for _, _, template in self._fields:
+            for match in template.pattern.finditer(template.template):
+                name = match.group("named") or match.group("braced")
+                if name is not None:
+                    names.add(name)
+        return names
+
+    def render(self, data: 'Mapping[str, object]',
+    budget: 'None | RenderBudget' = None):
+        """ Render the template with the placeholders replaced by the values in
+            the given data, and return the renderer containing the image. Only
+            the parts of the layout affected by the substituted values are
+            recomputed. The budget is checked like in `LayoutImage.generate` """
+        start = time.perf_counter()
+        self._substitute(data)
+        if budget is not None:
+            budget.check_nodes(self._tree)
+        self._tree.propagate_pos()
+        if budget is not None:
+            budget.check_layout(self._tree, start)
+        renderer = ImageRenderer(*self._tree.bounds())
+        self._tree.draw(renderer)
+        return renderer
+
+    def render_many(self, data: 'Iterable[Mapping[str, object]]'):
+        """ Render the template once for every mapping in the given data,
+            yielding the renderers one by one """
+        for values in data:
+            yield self.render(values)
+
+    def frames(self, data: 'Iterable[Mapping[str, object]]'):
+        """ Render the template once for every mapping in the given data as
+            the frames of an animation, yielding the frames one by one. Only the
+            parts of the layout and of the image affected by values that differ
+            from the previous frame are recomputed. All frames should have the
+            same size. The image of a frame is drawn over by the next frame, so
+            it should be copied to keep it """
+        document = None
+        for values in data:
+            if document is None:
+                self._substitute(values)
+                document = LayoutDocument.from_tree(self._tree)
+                size = document.renderer.width, document.renderer.height
+                yield Frame(document.renderer.image, [(0, 0, *size)])
+                continue
+            for node, name, template in self._fields:
+                value = _fill(template, values)
+                if name is None:
+                    if value != node.text:
+                        document.set_text(node, value)
+                elif value != node.attrib[name]:
+                    document.set_attribute(node, name, value)
+            areas = document.update()
+            if (document.renderer.width, document.renderer.height) != size:
+                raise ValueError("All frames should have the same size, which "
+                "can be set with the width and height of the image")
+            yield Frame(document.renderer.image, areas)
+
+    def save_animation(self, fp: 'str | os.PathLike[str] | IO[bytes]',
+    data: 'Iterable[Mapping[str, object]]', format: 'None | str' = None,
+    duration: int = 100, loops: int = 0):
+        """ Render the template for every mapping in the given data, and save
+            the frames as an animation to a file with the given filename, or to
+            a binary file object. The format can be APNG (the default for file
+            objects), GIF or WebP, and is derived from the filename if not
+            given. Every frame is shown for the given duration in milliseconds,
+            and the animation is played the given number of times, or forever
+            for 0. APNG animations are written frame by frame, encoding only
+            the changed part of every frame, so memory use does not grow with
+            the number of frames. GIF and WebP animations are encoded by
+            Pillow, which keeps all frames in memory """
+        if isinstance(fp, os.PathLike):
+            fp = os.fspath(fp)
+        if format is None:
+            format = "PNG" if not isinstance(fp, str) else {".gif": "GIF",
+            ".webp": "WEBP"}.get(os.path.splitext(fp)[1].lower(), "PNG")
+        format = format.upper()
+        if format in ("PNG", "APNG"):
+            if isinstance(fp, str):
+                with open(fp, "wb") as output_file:
+                    self.save_animation(output_file, data, format, duration,
+                    loops)
+                return
+            self._save_apng(fp, data, duration, loops)
+            return
+        frames = self.frames(data)
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("No frames to save")
+        first.image.copy().save(fp, format, save_all=True,
+        append_images=(frame.image.copy() for frame in frames),
+        duration=duration, loop=loops)
+
+    def __repr__(self):
+        """ Get a debug string representation of the layout tree """
+        return self._tree.__repr__()
+
+    def _substitute(self, data: 'Mapping[str, object]'):
+        """ Replace the placeholders in the layout tree by the values in the
+            given data """
+        for node, name, template in self._fields:
+            value = _fill(template, data)
+            if name is None:
+                node.set_text(value)
+            else:
+                node.set_attribute(name, value)
+
+    def _save_apng(self, fp: 'IO[bytes]',
+    data: 'Iterable[Mapping[str, object]]', duration: int, loops: int):
+        """ Save the frames rendered for the given data as an APNG animation,
+            encoding only the part of every frame that changed """
+        count = len(data) if isinstance(data, Sized) else None
+        writer = None
+        for frame in self.frames(data):
+            if writer is None:
+                writer = APNGWriter(fp, *frame.image.size, count, loops=loops)
+                writer.write_frame(frame.image, delay=duration)
+                continue
+            # Unchanged frames still need a frame, so repeat a single pixel
+            x0, y0, x1, y1 = 0, 0, 1, 1
+            if frame.areas:
+                x0 = min(x for x, _, _, _ in frame.areas)
+                y0 = min(y for _, y, _, _ in frame.areas)
+                x1 = max(x + dx for x, _, dx, _ in frame.areas)
+                y1 = max(y + dy for _, y, _, dy in frame.areas)
+            writer.write_frame(frame.image.crop((x0, y0, x1, y1)), x0, y0,
+            delay=duration)
+        if writer is None:
+            raise ValueError("No frames to save")
+        writer.close()
+
+    def _find_fields(self):
+        """ Find all text and attribute values containing placeholders in the
+            layout tree """
+        for node in self._tree.walk():
+            for name, value in node.attrib.items():
+                if "$" in value:
+                    self._fields.append((node, name, Template(value)))
+            if "$" in node.text:
+                self._fields.append((node, None, Template(node.text)))
@@ -0,0 +1,52 @@
+
+from .layoutnode import LayoutNode
+from .spatialindex import SpatialIndex
+
+class OcclusionCuller:
+    """ Finds the nodes of a laid out tree whose background (color and image)
+        is completely painted over by the background color of a single node
+        drawn later, so painting the background can be skipped. Only opaque
+        background colors hide what is below them, text and background images
+        are never used to hide anything, and text is always drawn. Backgrounds
+        smaller than a minimum area are not checked, since drawing them is
+        cheaper than checking them. Only a limited number of later backgrounds
+        are checked for every node, so culling takes linear time """
+
+    def __init__(self, tree: LayoutNode, min_area: int = 4096,
+    cell_size: int = 256, max_checks: int = 64):
+        """ Constructor, given the root of a tree that has already been laid
+            out, the minimum area of backgrounds to check in pixels, the grid
+            size of the index used to find overlapping backgrounds and the
+            maximum number of backgrounds to check for every node """
+        # Nodes whose background is painted over, and the node painting over
+        # it
+        self.covered: 'dict[LayoutNode, LayoutNode]' = {}
+        # The number of pixels of backgrounds that do not need to be painted
+        self.skipped_pixels = 0
+        # Backgrounds drawn later than the current node, which can cover it,
+        # with the nodes painting them
+        index: 'SpatialIndex[LayoutNode]' = SpatialIndex(cell_size)
+        for node in reversed(list(tree.walk())):
+            box = self._background_box(node)
+            if box is None or box[2] * box[3] < min_area:
+                continue
+            cover = index.find_containing(box, max_checks)
+            if cover is not None:
+                self.covered[node] = cover
+                self.skipped_pixels += box[2] * box[3]
+            if node.env["background-color"] != "none":
+                index.insert(box, node)
+
+    def _background_box(self, node: LayoutNode):
+        """ Get the box the background of a node paints, as (x, y, dx, dy), or
+            None if it paints no background """
+        dx, dy = node.size
+        if dx < 1 or dy < 1:
+            return None
+        if node.env["background-color"] != "none":
+            # Rectangles include their right and bottom edge
+            return (*node.pos, dx + 1, dy + 1)
+        if node.env["background-image"] != "none":
+            return (*node.pos, dx, dy)
+        return None
+
@@ -0,0 +1,92 @@
+
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+import time
+
+class Tracer:
+    """ Collects the time spent in phases of rendering, and counters of the
+        work done, such as the number of nodes or bytes encoded. Phases can be
+        nested, in which case the time of the inner phase is also included in
+        the outer phase. A tracer can be shared between threads """
+
+    # Whether anything is recorded, which can be checked before doing work
+    # that is only needed to record something
+    enabled = True
+
+    def __init__(self):
+        """ Constructor """
+        # Per phase name the number of calls, wall time and CPU time in seconds
+        self.phases: 'dict[str, list]' = {}
+        self.counters: 'dict[str, int]' = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """ Context manager that adds the time spent inside it to the phase
+            with the given name """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self._lock:
+                totals = self.phases.setdefault(name, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += wall
+                totals[2] += cpu
+
+    def count(self, name: str, amount: int = 1):
+        """ Increase the counter with the given name """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other: 'Tracer'):
+        """ Add all phase times and counters of another tracer to this one """
+        with self._lock:
+            for name, (calls, wall, cpu) in other.phases.items():
+                totals = self.phases.setdefault(name, [0, 0.0, 0.0])
+                totals[0] += calls
+                totals[1] += wall
+                totals[2] += cpu
+            for name, amount in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        """ Get a human readable table of the phases and counters """
+        lines = [f"{'phase':<20} {'calls':>8} {'wall ms':>10} {'cpu ms':>10}"]
+        with self._lock:
+            for name, (calls, wall, cpu) in self.phases.items():
+                lines.append(f"{name:<20} {calls:>8} {wall * 1000:>10.2f} "
+                f"{cpu * 1000:>10.2f}")
+            lines.append("")
+            lines.append(f"{'counter':<20} {'value':>8}")
+            for name, amount in sorted(self.counters.items()):
+                lines.append(f"{name:<20} {amount:>8}")
+        return "\n".join(lines)
+
+    def __getstate__(self):
+        """ Get the state for pickling, without the lock """
+        return {"phases": self.phases, "counters": self.counters}
+
+    def __setstate__(self, state: dict):
+        """ Restore the state after unpickling """
+        self.phases = state["phases"]
+        self.counters = state["counters"]
+        self._lock = Lock()
+
+class NullTracer:
+    """ A tracer that records nothing, used when profiling is disabled """
+
+    enabled = False
+
+    def phase(self, name: str):
+        """ Context manager that does nothing """
+        return _NULL_CONTEXT
+
+    def count(self, name: str, amount: int = 1):
+        """ Does nothing """
+
+_NULL_CONTEXT = nullcontext()
+
+null_tracer = NullTracer()
@@ -0,0 +1,158 @@
+
+from threading import Lock
+import hashlib
+import os
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+import PIL
+from . import __version__
+
+# Version of the cache key format and rendering output, which should be
+# increased whenever the same XML can render to a different image within a
+# release. The package version is part of the key as well
+_CACHE_VERSION = 1
+
+# Attributes that refer to files the rendered image depends on
+_FILE_ATTRIBUTES = {"font": "default", "background-image": "none"}
+
+class RenderCache:
+    """ A content-addressed cache of rendered PNG images on local disk. Images
+        are stored by a hash of the canonical XML and the files it refers to,
+        such as fonts and background images. Files are written atomically, so
+        multiple processes can share a cache directory. When the cache grows
+        larger than its size limit, the least recently used images are removed.
+        Other processes sharing the directory also add images, so the size of
+        the directory is scanned again every rescan interval in seconds """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024,
+    rescan_interval: float = 10.0):
+        """ Constructor, given the directory to store images in, the maximum
+            total size of the stored images in bytes and the time after which
+            the size of the directory is scanned again in seconds """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = Lock()
+        # Estimate of the total size of the cache, which is computed exactly
+        # when first needed, after every rescan interval and when it seems to
+        # exceed the maximum. In between, only the images stored by this
+        # process are added
+        self._bytes: 'None | int' = None
+        self._scanned = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, text: str, element: 'None | ElementTree.Element' = None):
+        """ Get the cache key of an XML layout. Layouts that only differ in
+            formatting that does not change the XML (such as attribute order or
+            comments) get the same key. Changes to referenced files give a
+            different key. The parsed XML can be given to avoid parsing it
+            again """
+        digest = hashlib.sha256()
+        version = f"{_CACHE_VERSION}:{__version__}:{PIL.__version__}\n"
+        digest.update(version.encode())
+        digest.update(ElementTree.canonicalize(text).encode())
+        paths = set()
+        if element is None:
+            element = ElementTree.fromstring(text)
+        for node in element.iter():
+            for name, ignored in _FILE_ATTRIBUTES.items():
+                value = node.get(name)
+                if value is not None and value not in (ignored, "inherit"):
+                    paths.add(value)
+        for path in sorted(paths):
+            try:
+                stat = os.stat(path)
+                state = f"{stat.st_size}:{stat.st_mtime_ns}"
+            except OSError:
+                state = "missing"
+            digest.update(f"\n{path}\0{state}".encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """ Get the path of the cached image with the given key, or None if it
+            is not in the cache """
+        path = self._path(key)
+        try:
+            # Mark the image as recently used
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, data: bytes):
+        """ Store an encoded PNG image with the given key, and return the path
+            of the stored image """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+        suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        with self._lock:
+            elapsed = time.monotonic() - self._scanned
+            if self._bytes is None or elapsed >= self.rescan_interval:
+                self._bytes = sum(size for _, size, _ in self._entries())
+                self._scanned = time.monotonic()
+            else:
+                self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def stats(self):
+        """ Get the cache counters as a dictionary """
+        with self._lock:
+            return {
+                "bytes": self._bytes,
+                "max-bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _path(self, key: str):
+        """ Get the path of the image with the given key """
+        return os.path.join(self.directory, key[:2], key + ".png")
+
+    def _entries(self):
+        """ Iterator over all stored images, as tuples of the path, the size
+            and the last time it was used """
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(".png"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """ Remove the least recently used images until the cache is below
+            90% of its maximum size. Should be called with the lock held """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._bytes = sum(size for _, size, _ in entries)
+        self._scanned = time.monotonic()
+        for path, size, _ in entries:
+            if self._bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self._bytes -= size
+            self.evictions += 1
@@ -1,2 +1,4 @@
-
-from .renderer import ImageRenderer
\ No newline at end of file
+from .renderer import ImageRenderer
+from .fontcache import FontCache, font_cache
+from .textmetrics import TextMeasure, TextMetrics, text_metrics
+from .imagecache import ImageCache, image_cache
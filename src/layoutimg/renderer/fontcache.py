@@ -0,0 +1,73 @@
+
+from collections import OrderedDict
+from threading import Lock
+from PIL import ImageFont
+
+class FontCache:
+    """ A bounded, thread-safe cache of loaded fonts, keyed by font path and
+        font size. The least recently used font is evicted when the cache is
+        full. Font objects are shared between all users of the cache """
+
+    def __init__(self, max_size: int = 128):
+        """ Constructor, given the maximum number of fonts to keep loaded """
+        self.max_size = max_size
+        self._fonts: 'OrderedDict[tuple[str | None, int], ImageFont.FreeTypeFont]' = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, font: 'str | None' = None, font_size: int = 64):
+        """ Get the font with the given path and size, loading it if it is not
+            in the cache. A path of None gives the default font. If the font
+            cannot be loaded, the default font is returned """
+        key = (font, font_size)
+        with self._lock:
+            if key in self._fonts:
+                self.hits += 1
+                self._fonts.move_to_end(key)
+                return self._fonts[key]
+            self.misses += 1
+        # Load outside of the lock, so other fonts can be looked up meanwhile
+        font_data = self._load(font, font_size)
+        with self._lock:
+            self._fonts[key] = font_data
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.max_size:
+                self._fonts.popitem(last=False)
+                self.evictions += 1
+        return font_data
+
+    def clear(self):
+        """ Remove all fonts from the cache and reset the counters """
+        with self._lock:
+            self._fonts.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Get the cache counters as a dictionary """
+        with self._lock:
+            return {
+                "size": len(self._fonts),
+                "max-size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        """ The number of fonts currently in the cache """
+        return len(self._fonts)
+
+    def _load(self, font: 'str | None', font_size: int):
+        """ Load a font from disk, or the default font if no path is given or
+            the font could not be loaded """
+        if font is not None:
+            try:
+                return ImageFont.truetype(font, size=font_size)
+            except OSError:
+                pass
+        return ImageFont.load_default(font_size)
+
+# The font cache shared by all renderers
+font_cache = FontCache()
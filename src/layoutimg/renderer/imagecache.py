@@ -0,0 +1,116 @@
+
+from collections import OrderedDict
+from threading import Lock
+import os
+import pathlib
+from PIL import Image
+
+class ImageCache:
+    """ A thread-safe cache of decoded images, limited to a memory budget in
+        bytes. Source images are cached by path and modification time, and
+        resized versions by path, modification time, size and resampling
+        filter. The least recently used images are evicted first when the
+        budget is exceeded. Images returned by the cache are shared, and should
+        not be modified """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """ Constructor, given the memory budget of the cache in bytes """
+        self.max_bytes = max_bytes
+        self._images: 'OrderedDict[tuple, Image.Image]' = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str, size: 'None | tuple[int, int]' = None,
+    resample: 'None | int' = None):
+        """ Get the image at the given path, decoded and optionally resized to
+            the given size with the given resampling filter. If no filter is
+            given, the Pillow default for the image is used """
+        mtime = os.stat(path).st_mtime_ns
+        if size is None:
+            return self._get((path, mtime), lambda: self._decode(path))
+        return self._get((path, mtime, *size, resample),
+        lambda: self._resize(self.get(path), size, resample))
+
+    def preload(self, directory: str, pattern: str = "*"):
+        """ Decode all images in the given directory matching the given glob
+            pattern into the cache. Files that are not images are skipped.
+            Returns the number of images loaded """
+        count = 0
+        for path in sorted(pathlib.Path(directory).glob(pattern)):
+            if not path.is_file():
+                continue
+            try:
+                self.get(str(path))
+            except (OSError, Image.UnidentifiedImageError):
+                continue
+            count += 1
+        return count
+
+    def clear(self):
+        """ Remove all images from the cache and reset the counters """
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Get the cache counters as a dictionary """
+        with self._lock:
+            return {
+                "size": len(self._images),
+                "bytes": self._bytes,
+                "max-bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        """ The number of images currently in the cache """
+        return len(self._images)
+
+    def _get(self, key: tuple, load):
+        """ Get an image from the cache by key, calling the given function to
+            load it if it is not in the cache """
+        with self._lock:
+            if key in self._images:
+                self.hits += 1
+                self._images.move_to_end(key)
+                return self._images[key]
+            self.misses += 1
+        image = load()
+        nbytes = self._image_bytes(image)
+        with self._lock:
+            if key in self._images or nbytes > self.max_bytes:
+                return image
+            self._images[key] = image
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= self._image_bytes(evicted)
+                self.evictions += 1
+        return image
+
+    def _decode(self, path: str):
+        """ Fully decode the image at the given path """
+        with Image.open(path) as image_file:
+            image_file.load()
+            return image_file
+
+    def _resize(self, image: Image.Image, size: 'tuple[int, int]',
+    resample: 'None | int'):
+        """ Resize an image, using the Pillow default filter if none is given
+            """
+        if resample is None:
+            return image.resize(size)
+        return image.resize(size, resample)
+
+    def _image_bytes(self, image: Image.Image):
+        """ An estimate of the number of bytes used by an image """
+        return image.width * image.height * len(image.getbands())
+
+# The image cache shared by all renderers
+image_cache = ImageCache()
@@ -0,0 +1,156 @@
+from typing import IO
+from PIL import Image
+import struct
+import zlib
+
+# Maximum number of compressed bytes to keep before writing an image data
+# chunk
+_CHUNK_SIZE = 1 << 16
+
+class PNGWriter:
+    """ A writer for 8-bit RGB PNG files that receives the image a number of
+        rows at a time, so the whole image never needs to be in memory """
+
+    def __init__(self, fp: 'IO[bytes]', width: int, height: int, *,
+    compress_level: int = 6):
+        """ Constructor, given a binary file object to write to, the size of
+            the image and the zlib compression level """
+        self._fp = fp
+        self.width = width
+        self.height = height
+        self._rows = 0
+        self._compress_level = compress_level
+        self._compressor = zlib.compressobj(compress_level)
+        self._buffer = bytearray()
+        self._fp.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits per channel, RGB, default compression, filter and interlacing
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2,
+        0, 0, 0))
+
+    def write_rows(self, data: bytes):
+        """ Write a number of rows of raw RGB pixel data """
+        stride = self.width * 3
+        if len(data) % stride != 0:
+            raise ValueError("Data does not contain a whole number of rows")
+        # Every row starts with the filter type, which is 0 (none)
+        rows = [b"\x00" + data[start:start + stride]
+        for start in range(0, len(data), stride)]
+        self._buffer += self._compressor.compress(b"".join(rows))
+        self._rows += len(rows)
+        if self._rows > self.height:
+            raise ValueError("More rows written than the height of the image")
+        if len(self._buffer) >= _CHUNK_SIZE:
+            self._flush()
+
+    def close(self):
+        """ Finish writing the PNG file. The file object is not closed """
+        if self._rows != self.height:
+            raise ValueError(f"Only {self._rows} of {self.height} rows were "
+            "written")
+        self._buffer += self._compressor.flush()
+        self._flush()
+        self._write_chunk(b"IEND", b"")
+
+    def _flush(self):
+        """ Write all buffered compressed data as an IDAT chunk """
+        if self._buffer:
+            self._write_chunk(b"IDAT", bytes(self._buffer))
+            self._buffer.clear()
+
+    def _write_chunk(self, kind: bytes, data: bytes):
+        """ Write a PNG chunk of the given type """
+        self._fp.write(struct.pack(">I", len(data)))
+        self._fp.write(kind)
+        self._fp.write(data)
+        self._fp.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+class APNGWriter(PNGWriter):
+    """ A writer for animated 8-bit RGB PNG files that receives the animation
+        one frame at a time, so only one frame needs to be in memory. Frames
+        after the first can cover a part of the image, which replaces that part
+        of the previous frame, so only the parts that changed are encoded.
+        Viewers that do not support animation show the first frame """
+
+    def __init__(self, fp: 'IO[bytes]', width: int, height: int,
+    frames: 'None | int' = None, *, loops: int = 0, compress_level: int = 6):
+        """ Constructor, given a binary file object to write to, the size of
+            the image, the number of frames, the number of times to play the
+            animation (0 to play it forever) and the zlib compression level.
+            If the number of frames is not given, the file object should be
+            seekable, and the number is filled in when closing """
+        if frames is None and not fp.seekable():
+            raise ValueError("The number of frames is needed to write to a "
+            "file object that is not seekable")
+        super().__init__(fp, width, height, compress_level=compress_level)
+        self.frames = frames
+        self.loops = loops
+        self._written = 0
+        # Frame control and data chunks share a sequence number
+        self._sequence = 0
+        self._control_pos = None if frames is not None else fp.tell()
+        self._write_chunk(b"acTL", struct.pack(">II", frames or 0, loops))
+
+    def write_frame(self, image: Image.Image, x: int = 0, y: int = 0,
+    delay: int = 100):
+        """ Write a frame, given as an RGB image that replaces the part of the
+            previous frame with the given top left corner, and the time to show
+            the frame in milliseconds. The first frame should cover the whole
+            image """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        width, height = image.size
+        if self._written == 0 and (x, y, width, height) != (0, 0, self.width,
+        self.height):
+            raise ValueError("The first frame should cover the whole image")
+        if (x < 0 or y < 0 or width < 1 or height < 1 or x + width > self.width
+        or y + height > self.height):
+            raise ValueError("Frame is outside of the image")
+        if self.frames is not None and self._written >= self.frames:
+            raise ValueError(f"More than {self.frames} frames written")
+        # No disposal and no blending, so the frame replaces the area it covers
+        self._write_chunk(b"fcTL", struct.pack(">IIIIIHHBB",
+        self._next_sequence(), width, height, x, y, delay, 1000, 0, 0))
+        if self._written == 0:
+            # The first frame is also the default image
+            self.write_rows(image.tobytes())
+            self._buffer += self._compressor.flush()
+            self._flush()
+        else:
+            self._write_frame_data(image.tobytes(), width)
+        self._written += 1
+
+    def close(self):
+        """ Finish writing the APNG file. The file object is not closed """
+        if self._written == 0:
+            raise ValueError("No frames were written")
+        if self.frames is not None and self._written != self.frames:
+            raise ValueError(f"Only {self._written} of {self.frames} frames "
+            "were written")
+        self._write_chunk(b"IEND", b"")
+        if self._control_pos is not None:
+            end = self._fp.tell()
+            self._fp.seek(self._control_pos)
+            self._write_chunk(b"acTL", struct.pack(">II", self._written,
+            self.loops))
+            self._fp.seek(end)
+
+    def _write_frame_data(self, data: bytes, width: int):
+        """ Compress raw RGB pixel data of a frame after the first and write it
+            as frame data chunks """
+        stride = width * 3
+        compressor = zlib.compressobj(self._compress_level)
+        buffer = bytearray()
+        for start in range(0, len(data), stride):
+            buffer += compressor.compress(b"\x00" + data[start:start + stride])
+            if len(buffer) >= _CHUNK_SIZE:
+                self._write_chunk(b"fdAT", struct.pack(">I",
+                self._next_sequence()) + bytes(buffer))
+                buffer.clear()
+        buffer += compressor.flush()
+        self._write_chunk(b"fdAT", struct.pack(">I", self._next_sequence()) +
+        bytes(buffer))
+
+    def _next_sequence(self):
+        """ Get the next sequence number of frame chunks """
+        self._sequence += 1
+        return self._sequence - 1
@@ -1,26 +1,107 @@
 
-from PIL import Image, ImageDraw, ImageFont
+from functools import lru_cache
+from heapq import heappop, heappush
+from typing import IO
+import io
+import os
+from PIL import Image, ImageColor, ImageDraw
+from ..profiling import Tracer, null_tracer
+from .fontcache import font_cache
+from .imagecache import image_cache
+
+# Factor by which the canvas capacity grows when the image has to be expanded
+# beyond its current capacity
+_GROWTH_FACTOR = 2
+
+@lru_cache(maxsize=1024)
+def _resolve_color(color: str, mode: str):
+    """ Convert a color name or code to a pixel value in an image mode, once
+        per color instead of for every shape drawn """
+    return ImageColor.getcolor(color, mode)
 
 class ImageRenderer:
     """ A class that makes it easier to render images, by introducing methods
         for drawing text and shapes. It creates a shape with a given size and
         expands it when attempting to draw something outside the image. The
         `expand` property controls whether the image should be expanded when
-        drawing outside its bounds, and can be adjusted at any point """
+        drawing outside its bounds, and can be adjusted at any point. The
+        underlying canvas is over-allocated when expanding, so that drawing
+        incrementally does not copy the whole image for every expansion.
+        Rectangles include their right and bottom edge, which is outside the
+        image if the image was only expanded to fit the rectangle. Such an
+        edge is drawn as soon as the image is expanded to include it, so the
+        result is the same as drawing to an image of the final size. The
+        image can also be a part of a larger image, in which case all drawing
+        coordinates are relative to the top left corner of the larger image.
+        A tracer can be given to profile reallocation, image decoding and
+        encoding """
 
     def __init__(self, width: int = 1, height: int = 1, *,
-    background_color: str = "white", expand: bool = True):
+    background_color: str = "white", expand: bool = True,
+    origin: 'tuple[int, int]' = (0, 0), tracer: 'None | Tracer' = None):
         """ Constructor, given starting width and height of the image, the
-            background color, and wether the image should be expanded when
-            drawing outside its bounds """
+            background color, wether the image should be expanded when
+            drawing outside its bounds, the coordinates that the top left
+            corner of the image has when drawing and an optional tracer """
+        self._tracer = null_tracer if tracer is None else tracer
         self._background_color = background_color
         self.expand = expand
+        self._origin = origin
+        # The visible size of the image, which can be smaller than the size of
+        # the (over-allocated) canvas
+        self._width, self._height = width, height
         self._image = Image.new("RGB", (width, height), self._background_color)
         self._draw = ImageDraw.Draw(self._image)
+        # Right and bottom edges of rectangles that are outside the visible
+        # image, as heaps of (x, order, y0, y1, fill) for columns and
+        # (y, order, x0, x1, fill) for rows. The order is the order of drawing
+        self._hidden_columns: 'list[tuple]' = []
+        self._hidden_rows: 'list[tuple]' = []
+        self._hidden_count = 0
+
+    @classmethod
+    def from_image(cls, image: Image.Image, *, background_color: str = "white",
+    expand: bool = True, tracer: 'None | Tracer' = None):
+        """ Create a renderer that draws on an existing RGB image """
+        renderer = cls(1, 1, background_color=background_color, expand=expand,
+        tracer=tracer)
+        renderer._width, renderer._height = image.size
+        renderer._image = image
+        renderer._draw = ImageDraw.Draw(image)
+        return renderer
+
+    def save(self, fp: 'str | os.PathLike[str] | IO[bytes]',
+    format: 'None | str' = None, *, quantize: bool = False, **params):
+        """ Save the rendered image to a file with the given filename, or to a
+            binary file object. If no format is given, it is derived from the
+            filename, or PNG is used for file objects. Other keyword arguments
+            are passed to the Pillow encoder, such as `compress_level` and
+            `compress_type` (the zlib strategy) for PNG, or `quality` for JPEG
+            and WebP. If `quantize` is set, images with at most 256 colors are
+            saved with a palette, without losing any colors """
+        if isinstance(fp, os.PathLike):
+            fp = os.fspath(fp)
+        if format is None and not isinstance(fp, str):
+            format = "PNG"
+        with self._tracer.phase("encode"):
+            image = self._quantized() if quantize else self.image
+            start = self._tell(fp) if self._tracer.enabled else None
+            image.save(fp, format, **params)
+        if start is not None:
+            end = os.path.getsize(fp) if isinstance(fp, str) else self._tell(fp)
+            if end is not None:
+                self._tracer.count("bytes encoded", end - start)
+
+    def to_bytes(self, format: str = "PNG", **params):
+        """ Get the encoded image as bytes, see `save` for the arguments """
+        output = io.BytesIO()
+        self.save(output, format, **params)
+        return output.getvalue()
 
-    def save(self, filename: str):
-        """ Save the rendered image to a PNG file with the given filename """
-        self._image.save(filename)
+    def to_buffer(self):
+        """ Get the raw RGB pixel data of the image, row by row, as a
+            memoryview """
+        return memoryview(self.image.tobytes())
 
     def draw_rect(self, x: int, y: int, dx: int, dy: int, *,
     color: str = "black"):
@@ -29,7 +110,11 @@ class ImageRenderer:
         if dx < 1 or dy < 1:
             return
         self.expand_image(x, y, dx, dy)
-        self._draw.rectangle((x, y, x + dx, y + dy), fill=color)
+        x, y = x - self._origin[0], y - self._origin[1]
+        fill = _resolve_color(color, self._image.mode)
+        self._draw.rectangle((x, y, x + dx, y + dy), fill=fill)
+        if self.expand:
+            self._hide_edges(x, y, x + dx, y + dy, fill)
 
     def draw_text(self, x: int, y: int, text: str, *, font: 'str | None' = None,
     color: str = "black", font_size: int = 64, only_bbox: bool = False):
@@ -45,34 +130,53 @@ class ImageRenderer:
         if only_bbox:
             return bbox
         self.expand_image(*bbox)
+        args["xy"] = self._local(x, y)
         self._draw.text(**args, fill=color)
         return bbox
 
     def draw_image(self, x: int, y: int, dx: int, dy: int, path: str):
         """ Draw another image onto this image, given the coordinates of the top
             left corner, the dimensions to draw and the path of the image to
-            draw """
+            draw. Decoded and resized images are reused through the image
+            cache """
         if dx < 1 or dy < 1:
             return
         self.expand_image(x, y, dx, dy)
-        with Image.open(path) as image_file:
-            resized_image = image_file.resize((dx, dy))
-            self._image.paste(resized_image, (x, y, x + dx, y + dy))
+        with self._tracer.phase("decode images"):
+            resized_image = image_cache.get(path, (dx, dy))
+        x, y = self._local(x, y)
+        self._image.paste(resized_image, (x, y, x + dx, y + dy))
+
+    def paste_image(self, x: int, y: int, image: Image.Image):
+        """ Paste an image onto this image, given the coordinates of the top
+            left corner. Unlike `draw_image`, the image is not expanded and
+            the pasted image is used as is """
+        self._image.paste(image, self._local(x, y))
 
     @property
     def image(self):
-        """ Get the PIL image that is being drawn on """
+        """ Get the PIL image that is being drawn on. Any over-allocated part
+            of the canvas is cropped off first """
+        if self._image.size != (self._width, self._height):
+            self._image = self._image.crop((0, 0, self._width, self._height))
+            self._draw = ImageDraw.Draw(self._image)
         return self._image
     
+    @property
+    def origin(self):
+        """ The coordinates of the top left corner of the image when drawing
+            """
+        return self._origin
+
     @property
     def width(self):
         """ The width of the image """
-        return self._image.width
+        return self._width
     
     @property
     def height(self):
         """ The height of the image """
-        return self._image.height
+        return self._height
 
     def __eq__(self, other: object) -> bool:
         """ Check if two drawings are the same (pixels are equal) """
@@ -80,15 +184,38 @@ class ImageRenderer:
 
     def _load_font(self, font: 'str | None' = None, font_size: int = 64):
         """ Load a font based on the path given and return the font object.
-            Could also be None, which will return None. If the font is not
-            found, None is returned as well """
-        if font is None:
-            return None
+            Could also be None, which will return the default font. If the font
+            is not found, the default font is returned as well. Fonts are
+            shared between renderers through the font cache """
+        return font_cache.get(font, font_size)
+    
+    def _quantized(self):
+        """ Get the image converted to a palette image if that can be done
+            without changing any colors, or the image itself otherwise """
+        colors = self.image.getcolors(256)
+        if colors is None:
+            return self.image
+        quantized = self.image.quantize(len(colors), Image.Quantize.MEDIANCUT,
+        dither=Image.Dither.NONE)
+        if quantized.convert("RGB").tobytes() != self.image.tobytes():
+            return self.image
+        return quantized
+
+    def _tell(self, fp: 'str | IO[bytes]'):
+        """ Get the position to start writing at in a file with the given
+            filename (which is overwritten) or in a file object, or None if the
+            file object does not know its position """
+        if isinstance(fp, str):
+            return 0
         try:
-            return ImageFont.truetype(font, size=font_size)
-        except OSError:
+            return fp.tell()
+        except (OSError, AttributeError, ValueError):
             return None
-    
+
+    def _local(self, x: int, y: int):
+        """ Convert drawing coordinates to coordinates in the image """
+        return x - self._origin[0], y - self._origin[1]
+
     def _bbox_convert(self, bbox: 'tuple[int, int, int, int]'):
         """ Convert a PIL bounding box to a bounding box of the form
             (x, y, dx, dy) """
@@ -96,15 +223,68 @@ class ImageRenderer:
 
     def expand_image(self, x: int, y: int, dx: int, dy: int):
         """ Expand the image, given some bounding box that should be included in
-            it. Note that negative coordinates will never be included """
+            it. Note that coordinates before the origin will never be included
+            """
         if not self.expand or dx < 1 or dy < 1:
             return
-        width, height = max(self.width, x + dx), max(self.height, y + dy)
-        if width == self.width and height == self.height:
+        x, y = x - self._origin[0], y - self._origin[1]
+        # Most boxes are already inside the image, so check this first
+        if x + dx <= self._width and y + dy <= self._height:
             return
-        new_image = Image.new(self._image.mode, (width, height),
-        self._background_color)
-        new_draw = ImageDraw.Draw(new_image)
-        new_image.paste(self._image)
+        width, height = max(self._width, x + dx), max(self._height, y + dy)
+        if width > self._image.width or height > self._image.height:
+            self._reallocate(width, height)
+        # Anything drawn outside the visible image before should not show up,
+        # so clear the area that is newly made visible
+        old_width, old_height = self.width, self.height
+        self._width, self._height = width, height
+        if width > old_width:
+            self._image.paste(self._background_color,
+            (old_width, 0, width, height))
+        if height > old_height:
+            self._image.paste(self._background_color,
+            (0, old_height, old_width, height))
+        self._draw_hidden_edges()
+
+    def _hide_edges(self, x0: int, y0: int, x1: int, y1: int, fill):
+        """ Remember the right and bottom edges of a rectangle drawn with the
+            given corners (in image coordinates), if they are outside the
+            visible image """
+        if x1 >= self._width:
+            heappush(self._hidden_columns, (x1, self._hidden_count, y0, y1,
+            fill))
+        if y1 >= self._height:
+            heappush(self._hidden_rows, (y1, self._hidden_count, x0, x1, fill))
+        self._hidden_count += 1
+
+    def _draw_hidden_edges(self):
+        """ Draw the edges of rectangles that were outside the visible image
+            and are inside it now, in the order the rectangles were drawn. A
+            corner is drawn with the column if the row is already visible,
+            and with the row otherwise """
+        edges = []
+        while self._hidden_columns and self._hidden_columns[0][0] < self._width:
+            x, order, y0, y1, fill = heappop(self._hidden_columns)
+            edges.append((order, (x, y0, x, min(y1, self._height - 1)), fill))
+        while self._hidden_rows and self._hidden_rows[0][0] < self._height:
+            y, order, x0, x1, fill = heappop(self._hidden_rows)
+            edges.append((order, (x0, y, min(x1, self._width - 1), y), fill))
+        edges.sort(key=lambda edge: edge[0])
+        for _, box, fill in edges:
+            self._draw.rectangle(box, fill=fill)
+
+    def _reallocate(self, width: int, height: int):
+        """ Allocate a new canvas that can contain at least the given width and
+            height. Dimensions that need to grow are grown geometrically """
+        self._tracer.count("canvas reallocations")
+        with self._tracer.phase("reallocate"):
+            capacity = list(self._image.size)
+            for index, needed in enumerate((width, height)):
+                if needed > capacity[index]:
+                    capacity[index] = max(needed,
+                    int(capacity[index] * _GROWTH_FACTOR))
+            new_image = Image.new(self._image.mode, tuple(capacity),
+            self._background_color)
+            new_image.paste(self._image)
         self._image = new_image
-        self._draw = new_draw
\ No newline at end of file
+        self._draw = ImageDraw.Draw(new_image)
@@ -0,0 +1,100 @@
+
+from collections import OrderedDict
+from threading import Lock, local
+from typing import Iterable, NamedTuple
+from PIL import Image, ImageDraw
+from .fontcache import FontCache, font_cache
+
+class TextMeasure(NamedTuple):
+    """ The measurements of a piece of text. The bounding box is given as
+        (x, y, dx, dy) for text drawn at the origin, and the advance is the
+        horizontal distance to where the next text would start """
+    bbox: 'tuple[int, int, int, int]'
+    advance: float
+
+class TextMetrics:
+    """ A bounded, thread-safe cache of text measurements, keyed by font path,
+        font size and text. Measurements are the same as the bounding boxes
+        returned by `ImageRenderer.draw_text` """
+
+    def __init__(self, max_size: int = 4096, fonts: FontCache = font_cache):
+        """ Constructor, given the maximum number of measurements to keep and
+            the font cache to load fonts from """
+        self.max_size = max_size
+        self._fonts = fonts
+        self._measures: 'OrderedDict[tuple[str | None, int, str], TextMeasure]' = OrderedDict()
+        self._lock = Lock()
+        # Drawing contexts that are only used to measure text, never drawn
+        # on. Every thread has its own, so no drawing state is shared
+        self._local = local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def measure(self, text: str, font: 'str | None' = None,
+    font_size: int = 64):
+        """ Get the measurements of the given text, drawn with the font with
+            the given path and size. A path of None gives the default font """
+        return self.measure_many((text,), font, font_size)[0]
+
+    def measure_many(self, texts: 'Iterable[str]', font: 'str | None' = None,
+    font_size: int = 64):
+        """ Get the measurements of multiple strings drawn with the same font,
+            in the same order as the given strings. The font is only looked up
+            once, and only strings that are not cached yet are measured """
+        texts = list(texts)
+        results: 'dict[str, TextMeasure]' = {}
+        with self._lock:
+            for text in texts:
+                key = (font, font_size, text)
+                if key in self._measures:
+                    self.hits += 1
+                    self._measures.move_to_end(key)
+                    results[text] = self._measures[key]
+        missing = [text for text in dict.fromkeys(texts) if text not in results]
+        if missing:
+            font_data = self._fonts.get(font, font_size)
+            measured = {text: self._measure(text, font_data)
+            for text in missing}
+            results.update(measured)
+            with self._lock:
+                self.misses += len(missing)
+                for text, measure in measured.items():
+                    self._measures[(font, font_size, text)] = measure
+                while len(self._measures) > self.max_size:
+                    self._measures.popitem(last=False)
+                    self.evictions += 1
+        return [results[text] for text in texts]
+
+    def clear(self):
+        """ Remove all measurements from the cache and reset the counters """
+        with self._lock:
+            self._measures.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Get the cache counters as a dictionary """
+        with self._lock:
+            return {
+                "size": len(self._measures),
+                "max-size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        """ The number of measurements currently in the cache """
+        return len(self._measures)
+
+    def _measure(self, text: str, font_data):
+        """ Measure text with a loaded font """
+        draw = getattr(self._local, "draw", None)
+        if draw is None:
+            draw = self._local.draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        x0, y0, x1, y1 = draw.textbbox((0, 0), text, font=font_data)
+        advance = max(font_data.getlength(line) for line in text.split("\n"))
+        return TextMeasure((x0, y0, x1 - x0, y1 - y0), advance)
+
+# The text metrics shared by all layouts
+text_metrics = TextMetrics()
@@ -0,0 +1,342 @@
+
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from typing import Mapping
+import json
+import os
+import signal
+import socketserver
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from .budget import BudgetExceededError, RenderBudget
+from .layoutimg import LayoutImage
+from .layoutnode import LayoutError
+from .layouttemplate import LayoutTemplate
+from .renderer import font_cache, image_cache, text_metrics
+
+class LatencyHistogram:
+    """ A thread-safe histogram of latencies in seconds, counted in buckets
+        with fixed upper bounds """
+
+    # Upper bounds of the buckets in seconds, the last bucket has no bound
+    BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0)
+
+    def __init__(self):
+        """ Constructor """
+        self._counts = [0] * (len(self.BOUNDS) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def add(self, seconds: float):
+        """ Count a latency """
+        with self._lock:
+            self._counts[bisect_left(self.BOUNDS, seconds)] += 1
+            self._sum += seconds
+
+    def stats(self):
+        """ Get the number of latencies, their sum and the count per bucket as
+            a dictionary. Buckets are keyed by their upper bound, with "+inf"
+            for the last bucket """
+        with self._lock:
+            bounds = [str(bound) for bound in self.BOUNDS] + ["+inf"]
+            return {
+                "count": sum(self._counts),
+                "sum": self._sum,
+                "buckets": dict(zip(bounds, self._counts)),
+            }
+
+class TemplateCache:
+    """ A thread-safe cache of compiled templates, keyed by their XML text.
+        Templates are changed while rendering, so every template has a lock
+        that should be held while rendering it. The least recently used
+        templates are evicted first """
+
+    def __init__(self, max_size: int = 64):
+        """ Constructor, given the maximum number of templates to keep """
+        self.max_size = max_size
+        self._templates: 'OrderedDict[str, tuple[LayoutTemplate, Lock]]' = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text: str):
+        """ Get the compiled template of some XML text and its lock, compiling
+            it the first time """
+        with self._lock:
+            if text in self._templates:
+                self.hits += 1
+                self._templates.move_to_end(text)
+                return self._templates[text]
+        # Compile outside the lock, so other templates can be used meanwhile
+        compiled = (LayoutTemplate(text), Lock())
+        with self._lock:
+            self.misses += 1
+            compiled = self._templates.setdefault(text, compiled)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+                self.evictions += 1
+            return compiled
+
+    def stats(self):
+        """ Get the cache counters as a dictionary """
+        with self._lock:
+            return {
+                "size": len(self._templates),
+                "max-size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        """ The number of templates currently in the cache """
+        return len(self._templates)
+
+class RenderServer:
+    """ A long-lived HTTP server rendering layouts to PNG images. Fonts,
+        decoded images and compiled templates stay in memory between requests,
+        which makes rendering small images much faster than starting a new
+        process for every image. Layouts are posted to /render, either as XML
+        or as a JSON object with the XML in "xml" and optionally template data
+        in "data". Latencies and cache statistics are available as JSON from
+        /metrics. Layouts are usually submitted by users, so a render budget
+        should be given to reject layouts that are too expensive to render """
+
+    def __init__(self, address: 'tuple[str, int] | str' = ("127.0.0.1", 0),
+    workers: 'None | int' = None, max_templates: int = 64,
+    max_body: int = 16 * 1024 * 1024, budget: 'None | RenderBudget' = None):
+        """ Constructor, given the host and port to listen on, or the path of
+            a Unix socket, the number of renders to run at the same time (by
+            default the number of CPUs), the number of compiled templates to
+            keep, the maximum size of a request body in bytes and the budget
+            of every render. The server listens directly, but only handles
+            requests once it is started """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_body = max_body
+        self.budget = budget
+        self.templates = TemplateCache(max_templates)
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._latencies: 'dict[str, LatencyHistogram]' = {}
+        self._statuses: 'dict[int, int]' = {}
+        self._in_flight = 0
+        self._lock = Lock()
+        self._closing = False
+        self._thread: 'None | Thread' = None
+        handler = type("Handler", (_RenderHandler,), {"render_server": self})
+        if isinstance(address, str):
+            self._server = _UnixHTTPServer(address, handler)
+        else:
+            self._server = _HTTPServer(address, handler)
+
+    @property
+    def address(self):
+        """ The address the server listens on, as a host and port or the path
+            of a Unix socket """
+        return self._server.server_address
+
+    def serve_forever(self, poll_interval: float = 0.1):
+        """ Handle requests until the server is shut down, checking for a
+            shutdown every poll interval in seconds """
+        self._server.serve_forever(poll_interval)
+
+    def start(self):
+        """ Handle requests in a background thread """
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        """ Stop accepting requests and wait for all requests that are being
+            handled to finish. Should not be called from the thread running
+            `serve_forever` """
+        self._closing = True
+        self._server.shutdown()
+        # Waits for the threads handling requests
+        self._server.server_close()
+        self._executor.shutdown(wait=True)
+        if self._thread is not None:
+            self._thread.join()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def render(self, body: bytes, content_type: str = "application/xml"):
+        """ Render the body of a request to PNG bytes on the worker pool """
+        if content_type.split(";")[0].strip() == "application/json":
+            request = json.loads(body)
+            if not isinstance(request, dict) or not isinstance(
+            request.get("xml"), str):
+                raise ValueError("Request should be an object with an xml "
+                "string")
+            text, data = request["xml"], request.get("data")
+            if data is not None and not isinstance(data, dict):
+                raise ValueError("Template data should be an object")
+        else:
+            text, data = body.decode("utf-8"), None
+        return self._executor.submit(self._render, text, data).result()
+
+    def metrics(self):
+        """ Get the request latencies, response statuses and cache statistics
+            as a dictionary """
+        with self._lock:
+            latencies = dict(self._latencies)
+            statuses = {str(status): count
+            for status, count in sorted(self._statuses.items())}
+            in_flight = self._in_flight
+        return {
+            "workers": self.workers,
+            "in-flight": in_flight,
+            "statuses": statuses,
+            "latency": {path: histogram.stats()
+            for path, histogram in sorted(latencies.items())},
+            "caches": {
+                "fonts": font_cache.stats(),
+                "images": image_cache.stats(),
+                "text": text_metrics.stats(),
+                "templates": self.templates.stats(),
+            },
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.shutdown()
+
+    def _render(self, text: str, data: 'None | Mapping[str, object]'):
+        """ Render XML text, as a template if data is given """
+        if data is None:
+            image = LayoutImage(text)
+            image.generate(budget=self.budget)
+            return image.to_bytes()
+        template, lock = self.templates.get(text)
+        with lock:
+            return template.render(data, self.budget).to_bytes()
+
+    def _started(self):
+        """ Count a request that is being handled """
+        with self._lock:
+            self._in_flight += 1
+
+    def _finished(self, path: str, status: int, seconds: float):
+        """ Count a handled request """
+        with self._lock:
+            self._in_flight -= 1
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+            if path not in self._latencies:
+                self._latencies[path] = LatencyHistogram()
+            histogram = self._latencies[path]
+        histogram.add(seconds)
+
+class _HTTPServer(ThreadingHTTPServer):
+    """ HTTP server that waits for the threads handling requests on close """
+    daemon_threads = False
+    block_on_close = True
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """ HTTP server listening on a Unix socket, which waits for the threads
+        handling requests on close """
+    daemon_threads = False
+    block_on_close = True
+
+class _RenderHandler(BaseHTTPRequestHandler):
+    """ Handles the requests of a render server """
+    render_server: RenderServer
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._handle(lambda: (200, "application/json",
+            json.dumps(self.render_server.metrics()).encode("utf-8")))
+        else:
+            self._handle(lambda: self._error(404, "Not found"))
+
+    def do_POST(self):
+        if self.path == "/render":
+            self._handle(self._render)
+        else:
+            self._handle(lambda: self._error(404, "Not found"))
+
+    def _render(self):
+        """ Render the posted layout """
+        server = self.render_server
+        if server._closing:
+            return self._error(503, "Server is shutting down")
+        length = self.headers.get("Content-Length", "0")
+        if not length.isdigit():
+            return self._error(400, "Content-Length should be a number of "
+            "bytes")
+        length = int(length)
+        if length > server.max_body:
+            return self._error(413, "Request body is too large")
+        body = self.rfile.read(length)
+        try:
+            data = server.render(body, self.headers.get("Content-Type",
+            "application/xml"))
+        except (ValueError, LayoutError, ElementTree.ParseError) as error:
+            # Invalid XML, JSON, attributes or attribute values, and missing
+            # template data
+            return self._error(400, f"{type(error).__name__}: {error}")
+        except OSError as error:
+            # Missing fonts or images
+            return self._error(422, f"{type(error).__name__}: {error}")
+        except BudgetExceededError as error:
+            return self._error(413, f"{type(error).__name__}: {error}")
+        return 200, "image/png", data
+
+    def _error(self, status: int, message: str):
+        return status, "text/plain; charset=utf-8", message.encode("utf-8")
+
+    def _handle(self, respond):
+        """ Respond to a request, measuring its latency until the response is
+            ready to be sent """
+        server = self.render_server
+        start = time.perf_counter()
+        server._started()
+        status = 500
+        try:
+            try:
+                status, content_type, body = respond()
+            except Exception as error:
+                status, content_type, body = self._error(500,
+                f"{type(error).__name__}: {error}")
+        finally:
+            # Counted before responding, so a client that got a response
+            # always finds its request in the metrics
+            path = self.path if status != 404 else "other"
+            server._finished(path, status, time.perf_counter() - start)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Clients of Unix sockets have no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return "unix"
+
+    def log_message(self, format: str, *args):
+        # Requests are counted in the metrics instead
+        pass
+
+def serve(address: 'tuple[str, int] | str', workers: 'None | int' = None,
+budget: 'None | RenderBudget' = None):
+    """ Run a render server until it is interrupted or terminated, then
+        finish the requests that are being handled """
+    server = RenderServer(address, workers, budget=budget).start()
+    print(f"Listening on {server.address}", file=sys.stderr)
+    stop = Event()
+    previous = signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        server.shutdown()
@@ -0,0 +1,126 @@
+from bisect import bisect_left
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+class SpatialIndex(Generic[T]):
+    """ An index of boxes on a uniform grid, used to quickly find all boxes
+        intersecting some area. Items are returned in the order they were
+        inserted, which for layout nodes is the order they are drawn in (as
+        long as no items are removed and inserted again) """
+
+    def __init__(self, cell_size: int = 256):
+        """ Constructor, given the size of the grid cells in pixels """
+        self._cell_size = cell_size
+        # Boxes as (x, y, dx, dy) with their items, in insertion order. Removed
+        # entries are replaced by None until the list is compacted
+        self._entries: 'list[None | tuple[tuple[int, int, int, int], T]]' = []
+        # Indices of the entries overlapping every grid cell, in increasing
+        # order
+        self._cells: 'dict[tuple[int, int], list[int]]' = {}
+        # Indices of the entries of every item (by identity) and box, to find
+        # the entry to remove without searching
+        self._positions: 'dict[tuple[int, tuple[int, ...]], list[int]]' = {}
+        self._count = 0
+
+    def insert(self, box: 'tuple[int, int, int, int]', item: T):
+        """ Add an item with a box given as (x, y, dx, dy) to the index """
+        if box[2] < 1 or box[3] < 1:
+            return
+        index = len(self._entries)
+        self._entries.append((box, item))
+        self._positions.setdefault((id(item), box), []).append(index)
+        for cell in self._cells_of(box):
+            self._cells.setdefault(cell, []).append(index)
+        self._count += 1
+
+    def remove(self, box: 'tuple[int, int, int, int]', item: T):
+        """ Remove an item from the index, given the same box it was inserted
+            with. Raises a KeyError if the item is not in the index """
+        key = (id(item), box)
+        positions = self._positions.get(key)
+        if positions is None:
+            raise KeyError("Item is not in the spatial index")
+        index = positions.pop()
+        if not positions:
+            del self._positions[key]
+        for cell in self._cells_of(box):
+            indices = self._cells[cell]
+            del indices[bisect_left(indices, index)]
+            if not indices:
+                del self._cells[cell]
+        self._entries[index] = None
+        self._count -= 1
+        # Keep the removed entries from taking up most of the list when items
+        # are removed and inserted again many times
+        if len(self._entries) > 2 * self._count + 64:
+            self._compact()
+
+    def query(self, box: 'tuple[int, int, int, int]'):
+        """ Get all items whose box intersects the given box, in the order they
+            were inserted """
+        indices: 'set[int]' = set()
+        for cell in self._cells_of(box):
+            indices.update(self._cells.get(cell, ()))
+        return [self._entries[index][1] for index in sorted(indices)
+        if self._intersects(self._entries[index][0], box)]
+
+    def find_containing(self, box: 'tuple[int, int, int, int]',
+    max_checks: 'None | int' = None):
+        """ Get the first item, in the order they were inserted, whose box
+            contains the given box, or None if there is none. Only the items in
+            the grid cell of the top left corner of the box are checked, since
+            a containing box overlaps that cell. At most the given number of
+            items are checked, after which None is returned """
+        cells = self._cells_of(box)
+        cell = next(cells, None)
+        if cell is None:
+            return None
+        for checks, index in enumerate(self._cells.get(cell, ())):
+            if max_checks is not None and checks >= max_checks:
+                break
+            other, item = self._entries[index]
+            if self._contains(other, box):
+                return item
+        return None
+
+    def __len__(self):
+        """ The number of items in the index """
+        return self._count
+
+    def _compact(self):
+        """ Drop the entries of removed items, keeping the other entries in
+            insertion order """
+        numbers: 'dict[int, int]' = {}
+        entries: 'list[None | tuple[tuple[int, int, int, int], T]]' = []
+        for index, entry in enumerate(self._entries):
+            if entry is not None:
+                numbers[index] = len(entries)
+                entries.append(entry)
+        self._entries = entries
+        self._cells = {cell: [numbers[index] for index in indices]
+        for cell, indices in self._cells.items()}
+        self._positions = {key: [numbers[index] for index in indices]
+        for key, indices in self._positions.items()}
+
+    def _cells_of(self, box: 'tuple[int, int, int, int]'):
+        """ Iterator over the grid cells a box overlaps """
+        x, y, dx, dy = box
+        if dx < 1 or dy < 1:
+            return
+        size = self._cell_size
+        for cx in range(x // size, (x + dx - 1) // size + 1):
+            for cy in range(y // size, (y + dy - 1) // size + 1):
+                yield cx, cy
+
+    def _intersects(self, a: 'tuple[int, int, int, int]',
+    b: 'tuple[int, int, int, int]'):
+        """ Check if two boxes given as (x, y, dx, dy) overlap """
+        return (a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and
+        a[1] < b[1] + b[3] and b[1] < a[1] + a[3])
+
+    def _contains(self, a: 'tuple[int, int, int, int]',
+    b: 'tuple[int, int, int, int]'):
+        """ Check if box a contains box b, both given as (x, y, dx, dy) """
+        return (a[0] <= b[0] and a[1] <= b[1] and b[0] + b[2] <= a[0] + a[2]
+        and b[1] + b[3] <= a[1] + a[3])
@@ -0,0 +1,156 @@
+
+from typing import Mapping
+from PIL import Image
+from .layoutnode import LayoutNode
+from .renderer import ImageRenderer
+
+class SpriteRenderer:
+    """ Draws a laid out layout tree, painting subtrees that occur multiple
+        times only once as a sprite, and pasting the sprite for every copy.
+        Subtrees are identical if their environments, text, sizes and the
+        relative positions of their nodes are the same. Only subtrees that
+        paint an opaque background over their whole box, with all descendents
+        painting inside that box, are used as sprites, so pasting gives exactly
+        the same pixels as drawing. Everything else is drawn as usual """
+
+    def __init__(self, tree: LayoutNode, min_count: int = 2,
+    covered: 'None | Mapping[LayoutNode, LayoutNode]' = None):
+        """ Constructor, given the root of a tree that has already been laid
+            out, the number of times a subtree should occur to be drawn as a
+            sprite and the nodes whose backgrounds are covered, mapped to the
+            nodes covering them (see `OcclusionCuller`) """
+        self._tree = tree
+        self._covered = {} if covered is None else covered
+        # Subtrees drawn as sprites, as the id of their sprite and the bottom
+        # right corner of the area they need in the image
+        self._roots: 'dict[LayoutNode, tuple[int, tuple[int, int]]]' = {}
+        self._sprites: 'dict[int, Image.Image]' = {}
+        self._find_roots(min_count)
+
+    @property
+    def sprite_count(self):
+        """ The number of different sprites drawn so far """
+        return len(self._sprites)
+
+    def draw(self, renderer: ImageRenderer):
+        """ Draw the tree to the given renderer """
+        if not self._roots:
+            self._tree.draw(renderer, self._covered)
+            return
+        stack = [self._tree]
+        while stack:
+            node = stack.pop()
+            root = self._roots.get(node)
+            if root is not None and self._fits(renderer, node, root[1]):
+                # Sprites are painted inside their background, so if that is
+                # covered by a node drawn after the sprite, the whole sprite is
+                cover = self._covered.get(node)
+                if cover is None or self._is_inside(cover, node):
+                    renderer.paste_image(*node.pos, self._sprite(node,
+                    root[0]))
+                continue
+            node.paint(renderer, node not in self._covered)
+            stack.extend(reversed(node.children))
+
+    def _find_roots(self, min_count: int):
+        """ Find the subtrees that are drawn as sprites """
+        # Ids of all different subtrees, so keys of parents do not nest the
+        # keys of their children
+        ids: 'dict[tuple, int]' = {}
+        keys: 'dict[LayoutNode, int]' = {}
+        counts: 'dict[int, int]' = {}
+        # Only subtrees that can be sprites and their descendents need keys.
+        # Children come before their parents in reverse document order
+        for node in reversed(self._candidates()):
+            x, y = node.pos
+            key = (node.env.key(), node.text, node.size,
+            tuple((child.pos[0] - x, child.pos[1] - y, keys[child])
+            for child in node.children))
+            keys[node] = sprite_id = ids.setdefault(key, len(ids))
+            counts[sprite_id] = counts.get(sprite_id, 0) + 1
+        # Per id whether it can be a sprite, with the area it needs in the image
+        # relative to its position. This is the same for all identical subtrees
+        sprites: 'dict[int, None | tuple[int, int]]' = {}
+        # Use the largest repeated subtrees, without nesting them
+        stack = [self._tree]
+        while stack:
+            node = stack.pop()
+            sprite_id = keys.get(node)
+            if sprite_id is not None and counts[sprite_id] >= min_count:
+                if sprite_id not in sprites:
+                    sprites[sprite_id] = self._sprite_extent(node)
+                extent = sprites[sprite_id]
+                if extent is not None:
+                    self._roots[node] = (sprite_id, (node.pos[0] + extent[0],
+                    node.pos[1] + extent[1]))
+                    continue
+            stack.extend(node.children)
+
+    def _candidates(self):
+        """ Get all nodes that might be drawn as a sprite and their
+            descendents, in document order """
+        nodes: 'list[LayoutNode]' = []
+        stack = [(self._tree, False)]
+        while stack:
+            node, inside = stack.pop()
+            inside = inside or self._is_candidate(node)
+            if inside:
+                nodes.append(node)
+            stack.extend((child, inside) for child in reversed(node.children))
+        return nodes
+
+    def _is_candidate(self, node: LayoutNode):
+        """ Check if a node paints a background and something else, which is
+            needed to be worth drawing as a sprite """
+        return node.env["background-color"] != "none" and bool(node.children
+        or node.env["render-text"] == "true" or
+        node.env["background-image"] != "none")
+
+    def _sprite_extent(self, node: LayoutNode):
+        """ Check if the subtree of a node can be drawn as a sprite. If so, get
+            the bottom right corner of the area the subtree needs in the image,
+            relative to the position of the node, and otherwise None. Single
+            nodes that only paint a rectangle are not worth it """
+        dx, dy = node.size
+        if not self._is_candidate(node) or dx < 1 or dy < 1:
+            return None
+        # Everything should be painted inside the background, which includes
+        # its right and bottom edge
+        x, y = node.pos
+        width, height = 0, 0
+        for descendent in node.walk():
+            box = descendent.paint_box()
+            if box is not None and (box[0] < x or box[1] < y or
+            box[0] + box[2] > x + dx + 1 or box[1] + box[3] > y + dy + 1):
+                return None
+            extent = descendent.extent()
+            if extent is not None:
+                width = max(width, extent[0] - x)
+                height = max(height, extent[1] - y)
+        return width, height
+
+    def _fits(self, renderer: ImageRenderer, node: LayoutNode,
+    extent: 'None | tuple[int, int]'):
+        """ Check if drawing a subtree would not expand the image, since
+            expanding while drawing can hide parts of what was drawn before """
+        if not renderer.expand or extent is None:
+            return True
+        ox, oy = renderer.origin
+        return (node.pos[0] >= ox and node.pos[1] >= oy and
+        extent[0] <= ox + renderer.width and extent[1] <= oy + renderer.height)
+
+    def _is_inside(self, node: LayoutNode, root: LayoutNode):
+        """ Check if a node is in the subtree of a root node """
+        while node is not None and node is not root:
+            node = node._parent
+        return node is root
+
+    def _sprite(self, node: LayoutNode, sprite_id: int):
+        """ Get the sprite of a subtree, drawing it the first time """
+        sprite = self._sprites.get(sprite_id)
+        if sprite is None:
+            region = ImageRenderer(node.size[0] + 1, node.size[1] + 1,
+            origin=node.pos, expand=False)
+            node.draw(region)
+            sprite = self._sprites[sprite_id] = region.image
+        return sprite
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO
+from PIL import Image
+import os
+from .layoutnode import LayoutNode
+from .profiling import Tracer
+from .renderer import ImageRenderer
+from .renderer.pngwriter import PNGWriter
+from .spatialindex import SpatialIndex
+
+class TiledRenderer:
+    """ Renders a laid out layout tree in fixed-size tiles, instead of as one
+        image. Only the nodes intersecting a tile are drawn to it, which are
+        found using a spatial index of the boxes the nodes paint. The result
+        is the same as drawing the whole tree to one image """
+
+    def __init__(self, tree: LayoutNode, tile_size: int = 256,
+    tracer: 'None | Tracer' = None):
+        """ Constructor, given the root of a tree that has already been laid
+            out, the width and height of the tiles and an optional tracer that
+            is passed to the renderers """
+        self.tile_size = tile_size
+        self._tracer = tracer
+        self.width, self.height = tree.bounds()
+        self._index: 'SpatialIndex[LayoutNode]' = SpatialIndex(tile_size)
+        for node in tree.walk():
+            box = node.paint_box()
+            if box is not None:
+                self._index.insert(box, node)
+
+    def render_region(self, x: int, y: int, dx: int, dy: int):
+        """ Draw the part of the image with the given top left corner and size
+            and return the renderer containing it """
+        renderer = ImageRenderer(dx, dy, origin=(x, y), expand=False,
+        tracer=self._tracer)
+        for node in self._index.query((x, y, dx, dy)):
+            node.paint(renderer)
+        return renderer
+
+    def tiles(self):
+        """ Iterator over the boxes of all tiles as (x, y, dx, dy), row by row
+            from the top left """
+        for y in range(0, self.height, self.tile_size):
+            for x in range(0, self.width, self.tile_size):
+                yield (x, y, min(self.tile_size, self.width - x),
+                min(self.tile_size, self.height - y))
+
+    def render(self, threads: int = 1):
+        """ Draw the whole image, rendering the tiles concurrently on the given
+            number of threads, and return the renderer containing the image.
+            Pillow releases the GIL while filling, resizing and pasting, so
+            tiles are drawn in parallel. The result is the same as drawing the
+            tree to a single image """
+        renderer = ImageRenderer(self.width, self.height, tracer=self._tracer)
+        boxes = list(self.tiles())
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            regions = executor.map(lambda box: self.render_region(*box), boxes)
+            for box, region in zip(boxes, regions):
+                renderer.image.paste(region.image, box[:2])
+        return renderer
+
+    def bands(self):
+        """ Iterator over horizontal bands of the image, each one tile high
+            (except possibly the last), from top to bottom. Each band is drawn
+            tile by tile """
+        for y in range(0, self.height, self.tile_size):
+            dy = min(self.tile_size, self.height - y)
+            band = Image.new("RGB", (self.width, dy))
+            for x in range(0, self.width, self.tile_size):
+                dx = min(self.tile_size, self.width - x)
+                band.paste(self.render_region(x, y, dx, dy).image, (x, 0))
+            yield band
+
+    def save(self, fp: 'str | os.PathLike[str] | IO[bytes]'):
+        """ Save the image as a PNG to a file with the given filename or to a
+            binary file object, encoding it one band at a time """
+        if isinstance(fp, os.PathLike):
+            fp = os.fspath(fp)
+        if isinstance(fp, str):
+            with open(fp, "wb") as output_file:
+                self.save(output_file)
+            return
+        writer = PNGWriter(fp, self.width, self.height)
+        for band in self.bands():
+            writer.write_rows(band.tobytes())
+        writer.close()
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import asyncio
+import io
+import time
+from PIL import Image
+from layoutimg import LayoutImage
+from layoutimg.asyncrender import RenderExecutor
+from layoutimg.renderer import text_metrics
+
+def layout(i: int):
+    return ("<image><col background-color='gray' width='300'>" +
+    "".join(f"<text font-size='{16 + j}'>Line {i} {j}\nsecond</text>"
+    for j in range(5)) + "</col></image>")
+
+def test_generate_from_threads():
+    expected = []
+    for i in range(8):
+        image = LayoutImage(layout(i))
+        image.generate()
+        expected.append(image.to_bytes())
+    text_metrics.clear()
+    def render(i):
+        image = LayoutImage(layout(i))
+        image.generate()
+        return image.to_bytes()
+    with ThreadPoolExecutor(8) as executor:
+        assert list(executor.map(render, range(8))) == expected
+
+def test_agenerate():
+    async def main():
+        images = [LayoutImage(layout(i)) for i in range(4)]
+        await asyncio.gather(*(image.agenerate() for image in images))
+        return images
+    for i, image in enumerate(asyncio.run(main())):
+        serial = LayoutImage(layout(i))
+        serial.generate()
+        assert image.to_bytes() == serial.to_bytes()
+
+def test_arender_to_bytes():
+    executor = RenderExecutor(ThreadPoolExecutor(2), max_concurrency=2)
+    data = asyncio.run(LayoutImage(layout(0)).arender_to_bytes("PNG",
+    executor=executor))
+    image = LayoutImage(layout(0))
+    image.generate()
+    assert Image.open(io.BytesIO(data)).tobytes() == \
+    image._get_renderer("test").image.tobytes()
+
+def test_max_concurrency():
+    executor = RenderExecutor(ThreadPoolExecutor(8), max_concurrency=2)
+    lock = Lock()
+    running, most = 0, 0
+    def work():
+        nonlocal running, most
+        with lock:
+            running += 1
+            most = max(most, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+    async def main():
+        tasks = [asyncio.ensure_future(executor.run(work)) for _ in range(6)]
+        await asyncio.sleep(0.005)
+        assert executor.running == 2 and executor.waiting == 4
+        await asyncio.gather(*tasks)
+    asyncio.run(main())
+    assert most == 2
+    assert executor.running == 0 and executor.waiting == 0
+
+def test_errors():
+    def fail():
+        raise ValueError("failed")
+    executor = RenderExecutor()
+    async def main():
+        try:
+            await executor.run(fail)
+        except ValueError:
+            return True
+    assert asyncio.run(main())
+    assert executor.running == 0
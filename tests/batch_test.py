@@ -0,0 +1,55 @@
+import pytest
+import os
+from layoutimg.batch import RenderResult, BatchSummary, find_files, run_batch
+
+def write_examples(directory, count: int):
+    """ Write a number of simple XML layouts to a directory """
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"card-{i}.xml")
+        with open(path, "w") as f:
+            f.write(f"<image><text>Card {i}</text></image>")
+        paths.append(path)
+    return paths
+
+def test_find_files(tmp_path):
+    paths = write_examples(str(tmp_path), 3)
+    assert list(find_files([str(tmp_path)])) == sorted(paths)
+    assert list(find_files([str(tmp_path / "*-1.xml")])) == [paths[1]]
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_batch(tmp_path, jobs: int):
+    paths = write_examples(str(tmp_path), 4)
+    paths.append(str(tmp_path / "missing.xml"))
+    finished = []
+    summary = run_batch(paths, jobs=jobs, on_result=finished.append)
+    assert sorted(result.path for result in finished) == sorted(paths)
+    assert [result.path for result in summary.failures] == [paths[-1]]
+    assert all(os.path.exists(path + ".png") for path in paths[:-1])
+
+def test_run_batch_layout(tmp_path):
+    paths = write_examples(str(tmp_path), 2)
+    summary = run_batch(paths, layout=True)
+    assert not summary.failures
+    assert all(os.path.exists(path + ".json") for path in paths)
+    assert not any(os.path.exists(path + ".png") for path in paths)
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_batch_assets(tmp_path, jobs: int):
+    from PIL import Image
+    assets = tmp_path / "assets"
+    assets.mkdir()
+    Image.new("RGB", (8, 8), "red").save(assets / "red.png")
+    path = str(tmp_path / "card.xml")
+    with open(path, "w") as f:
+        f.write(f"<image><col width='8' height='8' background-image="
+        f"'{assets / 'red.png'}'/></image>")
+    summary = run_batch([path], jobs=jobs, assets=[str(assets)])
+    assert not summary.failures and os.path.exists(path + ".png")
+
+def test_percentiles():
+    summary = BatchSummary()
+    for i in range(1, 101):
+        summary.add(RenderResult(str(i), i / 1000, None))
+    assert summary.percentile(50) == 0.05 and summary.percentile(99) == 0.099
+    assert "p50=50.0ms" in summary.report()
@@ -0,0 +1,92 @@
+import os
+import pytest
+from PIL import Image
+from layoutimg import (BudgetExceededError, LayoutImage, LayoutTemplate,
+RenderBudget)
+from layoutimg.batch import run_batch
+from layoutimg.budget import ResourceEstimate
+from layoutimg.profiling import Tracer
+
+huge = "<image><row width='100000' height='100000'/></image>"
+
+def cards(count: int):
+    return "<image>" + "<row><text>Card</text></row>" * count + "</image>"
+
+def test_estimate(tmp_path):
+    path = str(tmp_path / "photo.png")
+    Image.new("RGB", (40, 30)).save(path)
+    image = LayoutImage(f"<image><row width='20' height='10' background-image="
+    f"'{path}'/><row width='20' height='10' background-image='{path}'/>"
+    "<text>Hi</text></image>")
+    estimate = image.estimate()
+    assert estimate.nodes == 4 and estimate.text_measurements == 1
+    assert estimate.image_decodes == 1
+    assert estimate.image_bytes == 40 * 30 * 3 + 20 * 10 * 3
+    assert estimate.canvas_bytes == estimate.pixels * 3
+    assert (estimate.width, estimate.height) == image.layout()[0][3:5]
+
+def test_max_pixels():
+    tracer = Tracer()
+    image = LayoutImage(huge, tracer=tracer)
+    with pytest.raises(BudgetExceededError) as info:
+        image.generate(budget=RenderBudget(max_pixels=10 ** 6))
+    error = info.value
+    assert error.resource == "pixels" and error.limit == 10 ** 6
+    assert error.actual == ResourceEstimate.of(image._tree).pixels
+    # Fails before drawing anything
+    assert "draw" not in tracer.phases
+
+def test_max_nodes():
+    tracer = Tracer()
+    with pytest.raises(BudgetExceededError) as info:
+        LayoutImage(cards(100), tracer=tracer).generate(
+        budget=RenderBudget(max_nodes=50))
+    assert info.value.resource == "nodes" and info.value.actual == 201
+    # Fails before determining the layout
+    assert "layout" not in tracer.phases
+
+def test_max_image_bytes(tmp_path):
+    path = str(tmp_path / "photo.png")
+    Image.new("RGB", (100, 100)).save(path)
+    text = (f"<image><row width='10' height='10' background-image='{path}'/>"
+    "</image>")
+    with pytest.raises(BudgetExceededError) as info:
+        LayoutImage(text).generate(budget=RenderBudget(max_image_bytes=1000))
+    assert info.value.resource == "image bytes"
+    LayoutImage(text).generate(budget=RenderBudget(max_image_bytes=10 ** 6))
+
+def test_deadline():
+    with pytest.raises(BudgetExceededError) as info:
+        LayoutImage(cards(100)).generate(budget=RenderBudget(deadline=0))
+    assert info.value.resource == "seconds"
+
+def test_within_budget():
+    budget = RenderBudget(10 ** 6, 1000, 10 ** 6, 60)
+    image = LayoutImage(cards(10))
+    image.generate(budget=budget)
+    expected = LayoutImage(cards(10))
+    expected.generate()
+    assert image._renderer == expected._renderer
+
+def test_save_tiled(tmp_path):
+    with pytest.raises(BudgetExceededError):
+        LayoutImage(huge).save_tiled(str(tmp_path / "huge.png"),
+        budget=RenderBudget(max_pixels=10 ** 6))
+    assert not (tmp_path / "huge.png").exists()
+
+def test_run_batch(tmp_path):
+    path = str(tmp_path / "huge.xml")
+    with open(path, "w") as f:
+        f.write(huge)
+    summary = run_batch([path], budget=RenderBudget(max_pixels=10 ** 6))
+    assert summary.failures[0].error.startswith("BudgetExceededError")
+    assert not os.path.exists(path + ".png")
+
+def test_template():
+    template = LayoutTemplate("<image><row width='$size' height='$size' "
+    "background-color='red'/></image>")
+    budget = RenderBudget(max_pixels=10 ** 6)
+    assert template.render({"size": 100}, budget).image.getpixel((0, 0)) == \
+    (255, 0, 0)
+    with pytest.raises(BudgetExceededError):
+        template.render({"size": 100000}, budget)
@@ -0,0 +1,43 @@
+import pytest
+from threading import Thread
+from layoutimg.renderer import FontCache, ImageRenderer, font_cache
+
+def test_font_reused():
+    cache = FontCache()
+    assert cache.get(None, 20) is cache.get(None, 20)
+    assert cache.get(None, 20) is not cache.get(None, 30)
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+
+def test_lru_eviction():
+    cache = FontCache(max_size=2)
+    font = cache.get(None, 10)
+    cache.get(None, 20)
+    cache.get(None, 10)
+    cache.get(None, 30)
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+    assert cache.get(None, 10) is font
+
+def test_missing_font_falls_back():
+    cache = FontCache()
+    assert cache.get("does-not-exist.ttf", 20) is not None
+
+def test_shared_between_renderers():
+    font_cache.get(None, 17)
+    hits = font_cache.stats()["hits"]
+    ImageRenderer().draw_text(0, 0, "A", font_size=17)
+    ImageRenderer().draw_text(0, 0, "B", font_size=17)
+    assert font_cache.stats()["hits"] == hits + 2
+
+def test_concurrent_access():
+    cache = FontCache(max_size=4)
+    def load():
+        for i in range(50):
+            cache.get(None, 10 + i % 8)
+    threads = [Thread(target=load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 200 and len(cache) <= 4
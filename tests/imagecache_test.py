@@ -0,0 +1,39 @@
+import pytest
+import os
+import shutil
+from layoutimg.renderer import ImageCache
+
+path = "examples/image-import/Hello-World.png"
+
+def test_resized_reused():
+    cache = ImageCache()
+    image = cache.get(path, (50, 20))
+    assert image.size == (50, 20)
+    assert cache.get(path, (50, 20)) is image
+    # Source image and resized image were both decoded once
+    assert cache.stats()["misses"] == 2
+    cache.get(path, (30, 30))
+    assert cache.stats()["misses"] == 3
+
+def test_memory_budget():
+    cache = ImageCache(max_bytes=100 * 100 + 50 * 50)
+    cache.get(path, (50, 50))
+    cache.get(path, (40, 40))
+    stats = cache.stats()
+    assert stats["bytes"] <= cache.max_bytes and stats["evictions"] == 1
+
+def test_changed_file_reloaded(tmp_path):
+    copy = tmp_path / "image.png"
+    shutil.copy(path, copy)
+    cache = ImageCache()
+    image = cache.get(str(copy))
+    os.utime(copy, ns=(0, 0))
+    assert cache.get(str(copy)) is not image
+
+def test_preload(tmp_path):
+    shutil.copy(path, tmp_path / "image.png")
+    (tmp_path / "notes.txt").write_text("not an image")
+    cache = ImageCache()
+    assert cache.preload(str(tmp_path)) == 1
+    cache.get(str(tmp_path / "image.png"))
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import pytest
+import layoutimg
+
+def run_python(code: str):
+    """ Run Python code in a new interpreter and return its output """
+    return subprocess.run([sys.executable, "-c", code], check=True,
+    capture_output=True, text=True).stdout
+
+def test_import_is_lazy():
+    output = run_python("import sys, layoutimg\n"
+    "print(sorted(name for name in ('PIL', 'tomli', 'asyncio', "
+    "'layoutimg.layoutimg') if name in sys.modules))")
+    assert output.strip() == "[]"
+
+def test_import_time():
+    # The budget is generous, importing should take a few milliseconds
+    output = run_python("import time\n"
+    "start = time.perf_counter()\n"
+    "import layoutimg\n"
+    "print(time.perf_counter() - start)")
+    assert float(output) < 0.1
+
+def test_lazy_attributes():
+    from layoutimg.layoutimg import LayoutImage
+    from layoutimg.layoutnode import LayoutError
+    assert layoutimg.LayoutImage is LayoutImage
+    assert layoutimg.LayoutError is LayoutError
+    assert isinstance(layoutimg.CONFIG, dict)
+    assert {"CONFIG", "LayoutImage", "preload"} <= set(dir(layoutimg))
+    with pytest.raises(AttributeError):
+        layoutimg.Missing
+
+def test_preload(tmp_path):
+    from PIL import Image
+    from layoutimg.renderer import image_cache
+    Image.new("RGB", (4, 4), "red").save(tmp_path / "red.png")
+    image_cache.clear()
+    layoutimg.preload(fonts=[(None, 20)], images=[str(tmp_path)])
+    assert len(image_cache) == 1
@@ -1,5 +1,6 @@
 
 import pytest
+from layoutimg.layoutnode import _parse_length
 from layoutimg import LayoutImage
 
 def xml_to_renderer(text: str):
@@ -40,4 +41,93 @@ def test_equal_col_height():
         <col background-color='blue'><text>A</text></col>
         <col background-color='blue'><text>B</text></col>
     </image>"""
-    assert xml_to_renderer(textA).height == xml_to_renderer(textB).height
\ No newline at end of file
+    assert xml_to_renderer(textA).height == xml_to_renderer(textB).height
+
+def test_canvas_allocated_once():
+    text = open("examples/list.xml", "r").read()
+    renderer = xml_to_renderer(text)
+    assert renderer._image.size == (renderer.width, renderer.height)
+
+def test_env_overrides_defaults():
+    from layoutimg.layoutenv import LayoutEnv
+    envA, envB = LayoutEnv(), LayoutEnv()
+    envA.set_defauts("row")
+    envB.set_defauts("row")
+    envA["width"] = "20"
+    assert envA["width"] == "20" and envB["width"] == "auto"
+    assert list(envA) == list(envB) and "width" in envA
+    parent = LayoutEnv()
+    parent.set_defauts("image")
+    envB.inherit(parent)
+    assert envB["font-size"] == "64" and envB.default("font-size") == "inherit"
+
+def test_deep_nesting():
+    depth = 5000
+    text = ("<image>" + "<row>" * depth + "<text>Deep</text>" + "</row>" *
+    depth + "</image>")
+    image = LayoutImage(text)
+    image.generate()
+    assert len(repr(image).splitlines()) == depth + 2
+    assert image._renderer == xml_to_renderer("<image><text>Deep</text></image>")
+
+def test_from_file_same_as_text():
+    for filename in ("examples/list.xml", "examples/user-stats.xml"):
+        image = LayoutImage.from_file(filename)
+        image.generate()
+        assert image._renderer == xml_to_renderer(open(filename, "r").read())
+
+def test_from_stream():
+    import io
+    stream = io.BytesIO(b"<image><row><text>A</text></row><row/></image>")
+    image = LayoutImage.from_stream(stream)
+    assert [node.tag for node in image._tree.walk()] == ["image", "row",
+    "text", "row"]
+    image.generate()
+    assert image._renderer == xml_to_renderer(
+    "<image><row><text>A</text></row><row/></image>")
+
+def test_from_stream_root_tag():
+    import io
+    with pytest.raises(ValueError):
+        LayoutImage.from_stream(io.BytesIO(b"<row><text>A</text></row>"))
+
+def test_layout_boxes():
+    image = LayoutImage("<image><row height='20'><col width='30'/></row>"
+    "<text>A</text></image>")
+    boxes = image.layout()
+    assert [(box.tag, box.depth) for box in boxes] == [("image", 0), ("row", 1),
+    ("col", 2), ("text", 1)]
+    assert boxes[2][1:5] == (0, 0, 30, 20)
+    assert boxes[3].y == 20
+    assert image._renderer is None
+    image.generate()
+    assert [(*node.pos, *node.size) for node in image._tree.walk()] == [
+    box[1:5] for box in boxes]
+
+def test_layout_json():
+    import json
+    image = LayoutImage("<image><row width='10' height='20'/></image>")
+    assert json.loads(image.layout_json())[1] == {"tag": "row", "x": 0, "y": 0,
+    "width": 10, "height": 20, "depth": 1}
+
+def test_pixel_values_parsed_once():
+    _parse_length.cache_clear()
+    image = LayoutImage("<image>" + "<row x='5' font-size='20'><text>Hi</text>"
+    "</row>" * 10 + "</image>")
+    image.generate()
+    info = _parse_length.cache_info()
+    assert info.misses < 10 < info.hits
+    with pytest.raises(ValueError):
+        LayoutImage("<image><text font-size='50%'>Hi</text></image>").generate()
+
+def test_save_path(tmp_path):
+    from PIL import Image
+    image = LayoutImage("<image><row width='20' height='10' "
+    "background-color='red'/></image>")
+    image.generate()
+    image.save(tmp_path / "image.jpg")
+    image.save_tiled(tmp_path / "tiled.png")
+    with Image.open(tmp_path / "image.jpg") as saved:
+        assert saved.format == "JPEG"
+    with Image.open(tmp_path / "tiled.png") as saved:
+        assert saved.tobytes() == image.to_buffer()
@@ -0,0 +1,81 @@
+import pytest
+from layoutimg import LayoutDocument, LayoutImage
+
+text = """<image>
+    <row background-color="blue" height="40"><text>One</text></row>
+    <row><col width="50" height="50" background-color="red"></col>
+    <col width="50" height="50" background-color="green"></col></row>
+    <row><text text-color="gray">Three</text></row>
+</image>"""
+
+def xml_to_renderer(text: str):
+    image = LayoutImage(text)
+    image.generate()
+    return image._renderer
+
+def to_xml(node):
+    """ Get the XML of the current state of a layout tree """
+    attrib = "".join(f" {name}=\"{value}\"" for name, value in
+    node.attrib.items())
+    return (f"<{node.tag}{attrib}>{node.text}" + "".join(to_xml(child) for
+    child in node.children) + f"</{node.tag}>")
+
+def test_initial_image():
+    document = LayoutDocument(text)
+    assert document.renderer == xml_to_renderer(text)
+
+def test_paint_only_edit():
+    document = LayoutDocument(text)
+    red = document.root.children[1].children[0]
+    document.set_attribute(red, "background-color", "yellow")
+    areas = document.update()
+    assert areas == [(0, red.pos[1], 51, 51)]
+    assert document.renderer == xml_to_renderer(to_xml(document.root))
+
+def test_layout_edits():
+    document = LayoutDocument(text)
+    first, second, third = document.root.children
+    document.set_text(first.children[0], "A longer line of text")
+    document.update()
+    assert document.renderer == xml_to_renderer(to_xml(document.root))
+    document.set_attribute(second.children[0], "width", "200")
+    document.update()
+    assert document.renderer == xml_to_renderer(to_xml(document.root))
+    document.remove_child(first)
+    document.update()
+    assert document.renderer == xml_to_renderer(to_xml(document.root))
+    document.insert_child(document.root, 1, "<row background-color='black' "
+    "height='20'/>")
+    document.set_attribute(document.root, "text-color", "red")
+    document.update()
+    assert document.renderer == xml_to_renderer(to_xml(document.root))
+
+def test_image_shrinks():
+    document = LayoutDocument(text)
+    document.set_text(document.root.children[2].children[0],
+    "A very long line of text that makes the image wider")
+    document.update()
+    document.set_text(document.root.children[2].children[0], "Short")
+    document.update()
+    expected = xml_to_renderer(to_xml(document.root))
+    assert document.renderer.image.size == expected.image.size
+    assert document.renderer == expected
+
+def test_remove_root():
+    document = LayoutDocument(text)
+    with pytest.raises(ValueError):
+        document.remove_child(document.root)
+
+def test_many_edits():
+    document = LayoutDocument(text)
+    first = document.root.children[0]
+    for i in range(500):
+        document.set_text(first.children[0], "x" * (i % 7))
+        document.update()
+        if i % 3 == 0:
+            document.set_attribute(first, "background-color",
+            ("red", "blue")[i % 2])
+            document.update()
+    # Entries of removed nodes are dropped from the index
+    assert len(document._index._entries) <= 2 * len(document._index) + 64
+    assert document.renderer == xml_to_renderer(to_xml(document.root))
@@ -0,0 +1,152 @@
+import io
+import pytest
+from PIL import Image
+from layoutimg import LayoutError, LayoutImage, LayoutTemplate
+from layoutimg.layoutnode import LayoutNode
+
+source = """<image font-size="$size">
+    <row background-color="$color"><text>User: $name</text></row>
+    <row><col><text>Kills:</text></col><col><text>$kills</text></col></row>
+    <row><text>$$5</text></row>
+</image>"""
+
+users = [
+    {"size": 40, "color": "green", "name": "FluffyCat", "kills": 3},
+    {"size": 40, "color": "blue", "name": "Al", "kills": 12345},
+    {"size": 60, "color": "blue", "name": "Al", "kills": 12345},
+    {"size": 40, "color": "green", "name": "FluffyCat", "kills": 3},
+]
+
+def xml_to_renderer(text: str):
+    """ Convert XML text to a renderer which has the rendered image contained
+        """
+    image = LayoutImage(text)
+    image.generate()
+    return image._renderer
+
+def substitute(data: dict):
+    """ Substitute data into the template source by hand """
+    text = source.replace("$$", "\0")
+    for name, value in data.items():
+        text = text.replace(f"${name}", str(value))
+    return text.replace("\0", "$")
+
+def test_placeholders():
+    assert LayoutTemplate(source).placeholders == {"size", "color", "name",
+    "kills"}
+
+def test_render_same_as_image():
+    template = LayoutTemplate(source)
+    for data in users:
+        assert template.render(data) == xml_to_renderer(substitute(data))
+
+def test_render_many():
+    template = LayoutTemplate(source)
+    renderers = list(template.render_many(users))
+    assert len(renderers) == len(users)
+    assert renderers[0] == renderers[3]
+    assert renderers[0].width != renderers[1].width
+
+def count_layouts(monkeypatch: pytest.MonkeyPatch):
+    """ Count the number of nodes that have their size recomputed """
+    calls = []
+    original = LayoutNode._edit_size_after_children
+    def edit_size(node: LayoutNode, name: str):
+        calls.append(node)
+        original(node, name)
+    monkeypatch.setattr(LayoutNode, "_edit_size_after_children", edit_size)
+    return calls
+
+def test_paint_only_change_keeps_layout(monkeypatch: pytest.MonkeyPatch):
+    template = LayoutTemplate(source)
+    template.render(users[0])
+    calls = count_layouts(monkeypatch)
+    template.render(dict(users[0], color="red"))
+    assert len(calls) == 0
+
+def test_text_change_partial_layout(monkeypatch: pytest.MonkeyPatch):
+    template = LayoutTemplate(source)
+    template.render(users[0])
+    calls = count_layouts(monkeypatch)
+    template.render(dict(users[0], kills=4))
+    # Only the changed text, its ancestors and the rows below are laid out
+    assert 0 < len(set(calls)) < 10
+
+def test_missing_value():
+    with pytest.raises(KeyError):
+        LayoutTemplate(source).render({"size": 10})
+    with pytest.raises(LayoutError):
+        list(LayoutTemplate(source).frames([users[0], {"size": 10}]))
+
+progress = """<image width="200" height="40" background-color="white">
+    <row width="$done" min-width="0" height="20" background-color="green"/>
+    <text font-size="16">$label</text>
+</image>"""
+
+progress_data = [{"done": 20 * (i // 2), "label": f"{10 * (i // 2)}%"}
+for i in range(12)]
+
+def test_frames():
+    template = LayoutTemplate(progress)
+    expected = [LayoutTemplate(progress).render(data).image
+    for data in progress_data]
+    frames = list(frame.image.copy() for frame in template.frames(
+    progress_data))
+    assert [frame.tobytes() for frame in frames] == \
+    [image.tobytes() for image in expected]
+
+def test_frames_bar_grows():
+    frames = LayoutTemplate(progress).frames(progress_data)
+    for frame, data in zip(frames, progress_data):
+        green = [x for x in range(frame.image.width)
+        if frame.image.getpixel((x, 10)) == (0, 128, 0)]
+        assert len(green) == data["done"] + 1 if data["done"] else not green
+
+def test_frames_changed_areas():
+    frames = LayoutTemplate(progress).frames(progress_data)
+    first = next(frames)
+    assert first.areas == [(0, 0, *first.image.size)]
+    # Every second frame is the same as the one before it
+    assert next(frames).areas == []
+    assert next(frames).areas != []
+
+def test_frames_size_changes():
+    template = LayoutTemplate("<image><row width='$w' height='10' "
+    "background-color='red'/></image>")
+    with pytest.raises(ValueError):
+        list(template.frames([{"w": 10}, {"w": 20}]))
+
+@pytest.mark.parametrize("sized", [True, False])
+def test_save_apng(sized: bool):
+    output = io.BytesIO()
+    data = progress_data if sized else iter(progress_data)
+    LayoutTemplate(progress).save_animation(output, data, duration=50)
+    output.seek(0)
+    with Image.open(output) as animation:
+        assert animation.n_frames == len(progress_data)
+        for i, data in enumerate(progress_data):
+            animation.seek(i)
+            expected = LayoutTemplate(progress).render(data).image
+            assert animation.convert("RGB").tobytes() == expected.tobytes()
+
+def test_save_apng_unseekable():
+    class Unseekable(io.BytesIO):
+        def seekable(self):
+            return False
+    with pytest.raises(ValueError):
+        LayoutTemplate(progress).save_animation(Unseekable(),
+        iter(progress_data))
+
+@pytest.mark.parametrize("extension", ["gif", "webp"])
+def test_save_animation_pillow(tmp_path, extension: str):
+    path = str(tmp_path / f"progress.{extension}")
+    LayoutTemplate(progress).save_animation(path, progress_data)
+    with Image.open(path) as animation:
+        assert animation.format == extension.upper()
+        assert animation.is_animated
+
+def test_save_animation_path(tmp_path):
+    path = tmp_path / "progress.png"
+    LayoutTemplate(progress).save_animation(path, progress_data)
+    with Image.open(path) as animation:
+        assert animation.n_frames == len(progress_data)
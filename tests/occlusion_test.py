@@ -0,0 +1,77 @@
+import pytest
+from layoutimg import LayoutImage
+from layoutimg.occlusion import OcclusionCuller
+from layoutimg.profiling import Tracer
+from layoutimg.spatialindex import SpatialIndex
+
+def laid_out(text: str):
+    image = LayoutImage(text)
+    image.layout()
+    return image._tree
+
+def render(text: str, cull: bool):
+    image = LayoutImage(text)
+    image.generate(cull=cull)
+    return image._renderer
+
+def test_covered_background():
+    tree = laid_out("<image background-color='gray'><row width='100' "
+    "height='100' background-color='red'><col width='100' height='100' "
+    "background-color='blue'/></row></image>")
+    culler = OcclusionCuller(tree, min_area=1)
+    row = tree.children[0]
+    col = row.children[0]
+    assert culler.covered == {tree: col, row: col}
+    assert culler.skipped_pixels == 101 * 101 * 2
+
+def test_partially_covered():
+    tree = laid_out("<image><row width='100' height='100' "
+    "background-color='red'><col width='99' height='100' "
+    "background-color='blue'/></row></image>")
+    assert not OcclusionCuller(tree, min_area=1).covered
+
+def test_images_do_not_cover():
+    tree = laid_out("<image><row width='100' height='100' "
+    "background-color='red'><col width='100' height='100' background-image="
+    "'examples/image-import/Hello-World.png'/></row></image>")
+    assert not OcclusionCuller(tree, min_area=1).covered
+
+def test_min_area():
+    tree = laid_out("<image><row width='10' height='10' background-color='red'>"
+    "<col width='10' height='10' background-color='blue'/></row></image>")
+    assert not OcclusionCuller(tree).covered
+
+def test_same_image():
+    text = ("<image background-color='gray'><row width='200' height='120' "
+    "background-color='red'><text>Hidden</text><col width='200' height='120' "
+    "x='0' y='0' background-color='blue'><text>Shown</text></col></row>"
+    "<row height='100' background-color='green'/></image>")
+    assert render(text, True) == render(text, False)
+
+def test_counters():
+    tracer = Tracer()
+    image = LayoutImage("<image><row width='100' height='100' "
+    "background-color='red'><col width='100' height='100' "
+    "background-color='blue'/></row></image>", tracer=tracer)
+    image.generate()
+    assert tracer.counters["culled backgrounds"] == 1
+    assert tracer.counters["culled pixels"] == 101 * 101
+
+@pytest.mark.parametrize("shrink", [0, 1])
+def test_nested_panels_scale(monkeypatch: pytest.MonkeyPatch, shrink: int):
+    # Nested panels of the same size cover each other, panels that get
+    # narrower do not. Both take a bounded number of checks per panel
+    checks = []
+    contains = SpatialIndex._contains
+    def count(*args):
+        checks.append(1)
+        return contains(*args)
+    monkeypatch.setattr(SpatialIndex, "_contains", count)
+    for depth in (500, 2000):
+        tree = laid_out("<image>" + "".join(f"<row width='{5000 - shrink * i}' "
+        "min-width='0' background-color='red'>" for i in range(depth))
+        + "<text>Deep</text>" + "</row>" * depth + "</image>")
+        checks.clear()
+        culler = OcclusionCuller(tree, max_checks=64)
+        assert len(culler.covered) == (0 if shrink else depth - 1)
+        assert len(checks) <= 64 * depth
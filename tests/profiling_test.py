@@ -0,0 +1,53 @@
+import pytest
+import io
+import pickle
+from layoutimg import LayoutImage
+from layoutimg.profiling import Tracer, null_tracer
+from layoutimg.renderer import ImageRenderer
+
+text = """<image>
+    <row background-image="examples/image-import/Hello-World.png" width="50"
+    height="50"/>
+    <text>Hello</text>
+</image>"""
+
+def test_phases_and_counters():
+    tracer = Tracer()
+    image = LayoutImage(text, tracer=tracer)
+    image.generate()
+    output = io.BytesIO()
+    image.save(output)
+    assert set(tracer.phases) == {"parse", "build", "inherit", "layout",
+    "cull", "draw", "decode images", "encode"}
+    assert all(calls == 1 for calls, _, _ in tracer.phases.values())
+    assert tracer.counters["nodes"] == 3
+    assert tracer.counters["bytes encoded"] == len(output.getvalue())
+    assert "encode" in tracer.report()
+
+def test_reallocations_counted():
+    tracer = Tracer()
+    renderer = ImageRenderer(tracer=tracer)
+    renderer.draw_rect(0, 0, 10, 10)
+    renderer.draw_rect(0, 0, 15, 15)
+    renderer.draw_rect(0, 0, 20, 20)
+    assert tracer.counters["canvas reallocations"] == 2
+
+def test_same_image_with_tracer():
+    image = LayoutImage(text)
+    image.generate()
+    traced = LayoutImage(text, tracer=Tracer())
+    traced.generate(threads=2, tile_size=16)
+    assert image._renderer == traced._renderer
+
+def test_merge_and_pickle():
+    tracer = Tracer()
+    with tracer.phase("draw"):
+        tracer.count("nodes", 2)
+    combined = pickle.loads(pickle.dumps(tracer))
+    combined.merge(tracer)
+    assert combined.phases["draw"][0] == 2 and combined.counters["nodes"] == 4
+
+def test_null_tracer():
+    with null_tracer.phase("draw"):
+        null_tracer.count("nodes")
+    assert not null_tracer.enabled
@@ -0,0 +1,100 @@
+import pytest
+import io
+import os
+import shutil
+from layoutimg import LayoutImage
+from layoutimg import rendercache
+from layoutimg.rendercache import RenderCache
+
+text = """<image>
+    <row background-color="blue" width="200"><text>Hello</text></row>
+</image>"""
+
+def test_cache_hit(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    first = LayoutImage(text)
+    first.generate(cache=cache)
+    second = LayoutImage(text)
+    second.generate(cache=cache)
+    assert second._renderer is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert second.to_bytes() == first.to_bytes()
+    output = io.BytesIO()
+    second.save(output)
+    assert output.getvalue() == first._renderer.to_bytes()
+    assert second.to_buffer() == first.to_buffer()
+
+def test_canonical_key(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    textA = "<image><row width='20' height='30'/></image>"
+    textB = "<image><!-- comment --><row height=\"30\" width=\"20\"></row></image>"
+    assert cache.key(textA) == cache.key(textB)
+    assert cache.key(textA) != cache.key("<image><row width='21'/></image>")
+
+def test_key_includes_version(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    cache = RenderCache(str(tmp_path))
+    key = cache.key(text)
+    monkeypatch.setattr(rendercache, "__version__", "0.0.0")
+    assert cache.key(text) != key
+
+def test_key_includes_files(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"))
+    image_path = tmp_path / "image.png"
+    shutil.copy("examples/image-import/Hello-World.png", image_path)
+    layout = f"<image><row width='20' height='20' background-image='{image_path}'/></image>"
+    key = cache.key(layout)
+    os.utime(image_path, ns=(0, 0))
+    assert cache.key(layout) != key
+
+def test_eviction(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=1)
+    for width in range(10, 15):
+        image = LayoutImage(f"<image><row width='{width}' height='10'/></image>")
+        image.generate(cache=cache)
+    assert cache.stats()["evictions"] > 0
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names
+    if name.endswith(".tmp")]
+
+def test_shared_eviction(tmp_path):
+    # Every cache scans the directory again, so images stored by the other
+    # cache are counted
+    caches = [RenderCache(str(tmp_path), max_bytes=500, rescan_interval=0)
+    for _ in range(2)]
+    for width in range(10, 30):
+        image = LayoutImage(f"<image><row width='{width}' height='10' "
+        f"background-color='#{width:02}{width:02}{width:02}'/></image>")
+        image.generate(cache=caches[width % 2])
+        total = sum(size for _, size, _ in caches[0]._entries())
+        assert total <= 500
+
+@pytest.mark.parametrize("action", ["save", "save_path", "to_bytes",
+"to_buffer"])
+def test_evicted_before_use(tmp_path, action):
+    cache = RenderCache(str(tmp_path / "cache"))
+    expected = LayoutImage(text)
+    expected.generate()
+    LayoutImage(text).generate(cache=cache)
+    image = LayoutImage(text)
+    image.generate(cache=cache)
+    # Another process removes the image from the cache
+    os.remove(image._cached)
+    if action == "save":
+        output = io.BytesIO()
+        image.save(output)
+        assert output.getvalue() == expected.to_bytes()
+    elif action == "save_path":
+        image.save(str(tmp_path / "output.png"))
+        with open(tmp_path / "output.png", "rb") as output:
+            assert output.read() == expected.to_bytes()
+    elif action == "to_bytes":
+        assert image.to_bytes() == expected.to_bytes()
+    else:
+        assert image.to_buffer() == expected.to_buffer()
+
+def test_save_path(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"))
+    LayoutImage(text).generate(cache=cache)
+    image = LayoutImage(text)
+    image.generate(cache=cache)
+    image.save(tmp_path / "output.png")
+    assert (tmp_path / "output.png").read_bytes() == image.to_bytes()
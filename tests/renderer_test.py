@@ -1,5 +1,6 @@
 
 import pytest
+from layoutimg import LayoutImage
 from layoutimg.renderer import ImageRenderer
 
 def test_multiple_rect():
@@ -30,4 +31,111 @@ def test_disable_expand():
 def test_very_long_text():
     r = ImageRenderer()
     text = "Lorem Ipsum " * 100
-    r.draw_text(0, 0, text)
\ No newline at end of file
+    r.draw_text(0, 0, text)
+
+def test_incremental_expand():
+    rA = ImageRenderer()
+    rB = ImageRenderer(100, 300)
+    for r in (rA, rB):
+        for i in range(30):
+            r.draw_rect(0, i * 10, 100, 10, color=("blue", "red")[i % 2])
+    assert rA.width == 100 and rA.height == 300
+    assert rA == rB
+
+def test_expand_hides_clipped_drawing():
+    rA = ImageRenderer(20, 20)
+    rA.draw_rect(0, 0, 100, 10, color="black")
+    rA.expand = False
+    rA.draw_rect(150, 0, 100, 100, color="black")
+    rA.expand = True
+    rA.draw_rect(0, 150, 200, 50, color="black")
+    rB = ImageRenderer(20, 20)
+    rB.draw_rect(0, 0, 100, 10, color="black")
+    rB.draw_rect(0, 150, 200, 50, color="black")
+    assert rA == rB
+
+def test_expand_draws_hidden_edges():
+    # Rectangles include their right and bottom edges, which are drawn once
+    # the image is expanded to include them, as if the image had its final
+    # size from the start
+    rA = ImageRenderer()
+    rB = ImageRenderer(31, 26)
+    for r in (rA, rB):
+        r.draw_rect(0, 0, 10, 10, color="red")
+        r.draw_rect(0, 0, 5, 20, color="blue")
+        r.draw_rect(30, 25, 1, 1, color="green")
+    assert rA.width == 31 and rA.height == 26
+    assert rA == rB
+    assert rA.image.getpixel((10, 5)) == (255, 0, 0)
+    assert rA.image.getpixel((10, 10)) == (255, 0, 0)
+    assert rA.image.getpixel((5, 20)) == (0, 0, 255)
+
+def test_generate_draws_edges():
+    image = LayoutImage("<image><text background-color='black' font-size='35' "
+    "max-height='20'>Wg</text></image>")
+    image.generate()
+    # The bottom edge of the background is drawn, since the text makes the
+    # image taller
+    renderer = image._renderer
+    assert renderer.height > 21
+    assert all(renderer.image.getpixel((x, 20)) == (0, 0, 0)
+    for x in range(renderer.width - 1))
+    growing = ImageRenderer()
+    image._tree.draw(growing)
+    assert growing == renderer
+
+def checkerboard():
+    """ Get a renderer with a checkerboard image drawn to it """
+    r = ImageRenderer(80, 80)
+    for i in range(8):
+        for j in range(8):
+            r.draw_rect(i * 10, j * 10, 10, 10,
+            color=("black", "white")[(i + j) % 2])
+    return r
+
+def test_to_bytes():
+    import io
+    from PIL import Image
+    r = checkerboard()
+    output = io.BytesIO()
+    r.save(output)
+    assert output.getvalue() == r.to_bytes()
+    assert Image.open(io.BytesIO(r.to_bytes())).tobytes() == r.image.tobytes()
+    assert r.to_bytes("PNG", compress_level=1) != r.to_bytes("PNG",
+    compress_level=9)
+
+def test_quantize_lossless():
+    import io
+    from PIL import Image
+    r = checkerboard()
+    r.draw_text(0, 0, "Hi", color="red", font_size=30)
+    data = r.to_bytes(quantize=True)
+    image = Image.open(io.BytesIO(data))
+    assert image.mode == "P"
+    assert image.convert("RGB").tobytes() == r.image.tobytes()
+    assert len(data) < len(r.to_bytes())
+
+def test_lossy_quality():
+    r = checkerboard()
+    r.draw_text(0, 0, "Hi", color="red", font_size=30)
+    assert len(r.to_bytes("JPEG", quality=10)) < len(r.to_bytes("JPEG",
+    quality=95))
+
+def test_to_buffer():
+    r = checkerboard()
+    buffer = r.to_buffer()
+    assert len(buffer) == 80 * 80 * 3 and bytes(buffer[:3]) == b"\0\0\0"
+
+def test_rect_colors():
+    from PIL import Image, ImageDraw
+    colors = ["red", "#0f0", "#0000ff", "#12345680", "rgb(10, 20, 30)",
+    "hsl(120, 50%, 50%)"]
+    renderer = ImageRenderer(100, 20)
+    expected = Image.new("RGB", (100, 20), "white")
+    draw = ImageDraw.Draw(expected)
+    for i, color in enumerate(colors):
+        renderer.draw_rect(i * 15, 0, 10, 10, color=color)
+        draw.rectangle((i * 15, 0, i * 15 + 10, 10), fill=color)
+    assert renderer.image.tobytes() == expected.tobytes()
+    with pytest.raises(ValueError):
+        renderer.draw_rect(0, 0, 5, 5, color="not-a-color")
@@ -0,0 +1,149 @@
+from threading import Thread
+import http.client
+import io
+import json
+import socket
+import time
+import pytest
+from PIL import Image
+from layoutimg import LayoutImage, LayoutTemplate, RenderBudget
+from layoutimg.server import LatencyHistogram, RenderServer
+
+card = "<image><text font-size='20'>Card</text></image>"
+template = "<image><text font-size='20'>Hello $name</text></image>"
+
+class UnixConnection(http.client.HTTPConnection):
+    """ HTTP connection over a Unix socket """
+
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._path)
+
+def request(server: RenderServer, method: str, path: str, body=None,
+headers={}):
+    """ Send a request to a server, returning the status and body """
+    if isinstance(server.address, str):
+        connection = UnixConnection(server.address)
+    else:
+        connection = http.client.HTTPConnection(*server.address)
+    try:
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+def pixels(data: bytes):
+    return Image.open(io.BytesIO(data)).convert("RGB").tobytes()
+
+@pytest.fixture
+def server():
+    with RenderServer(workers=2) as server:
+        yield server
+
+def test_render_xml(server):
+    status, data = request(server, "POST", "/render", card,
+    {"Content-Type": "application/xml"})
+    assert status == 200
+    image = LayoutImage(card)
+    image.generate()
+    assert pixels(data) == pixels(image.to_bytes())
+
+def test_render_template(server):
+    for name in ["World", "Server", "World"]:
+        status, data = request(server, "POST", "/render", json.dumps({
+            "xml": template, "data": {"name": name}}),
+            {"Content-Type": "application/json"})
+        assert status == 200
+        expected = LayoutTemplate(template).render({"name": name})
+        assert pixels(data) == expected.image.tobytes()
+    stats = server.templates.stats()
+    assert stats["misses"] == 1 and stats["hits"] == 2
+
+@pytest.mark.parametrize("body, headers", [
+    ("<image><text>", {}),
+    ("<text>No image</text>", {}),
+    ("{\"data\": {}}", {"Content-Type": "application/json"}),
+    (json.dumps({"xml": template, "data": {}}),
+    {"Content-Type": "application/json"}),
+    ("<image><text bogus='1'>Text</text></image>", {}),
+    (json.dumps({"xml": "<image><text bogus='$x'>Text</text></image>",
+    "data": {"x": 1}}), {"Content-Type": "application/json"}),
+    ("", {"Content-Length": "ten"}),
+])
+def test_bad_requests(server, body, headers):
+    status, _ = request(server, "POST", "/render", body, headers)
+    assert status == 400
+
+@pytest.mark.parametrize("error", [AttributeError, KeyError])
+def test_server_errors(server, error):
+    # Errors that are not caused by the layout are bugs
+    def broken_render(*args):
+        raise error("bug")
+    server._render = broken_render
+    status, _ = request(server, "POST", "/render", card)
+    assert status == 500
+
+def test_not_found(server):
+    assert request(server, "GET", "/missing")[0] == 404
+    assert request(server, "POST", "/missing", "")[0] == 404
+
+def test_metrics(server):
+    request(server, "POST", "/render", card)
+    request(server, "POST", "/render", "<image>")
+    status, data = request(server, "GET", "/metrics")
+    assert status == 200
+    metrics = json.loads(data)
+    assert metrics["statuses"] == {"200": 1, "400": 1}
+    assert metrics["latency"]["/render"]["count"] == 2
+    assert metrics["workers"] == 2 and metrics["in-flight"] == 1
+    assert set(metrics["caches"]) == {"fonts", "images", "text",
+    "templates"}
+
+def test_unix_socket(tmp_path):
+    path = str(tmp_path / "render.sock")
+    with RenderServer(path) as server:
+        status, data = request(server, "POST", "/render", card)
+        assert status == 200 and pixels(data)
+    assert not (tmp_path / "render.sock").exists()
+
+def test_drain_on_shutdown():
+    server = RenderServer().start()
+    render = server._render
+    def slow_render(*args):
+        time.sleep(0.2)
+        return render(*args)
+    server._render = slow_render
+    results = []
+    client = Thread(target=lambda: results.append(request(server, "POST",
+    "/render", card)))
+    client.start()
+    time.sleep(0.05)
+    server.shutdown()
+    client.join()
+    assert results[0][0] == 200 and pixels(results[0][1])
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    for seconds in [0.0005, 0.003, 0.003, 20]:
+        histogram.add(seconds)
+    stats = histogram.stats()
+    assert stats["count"] == 4
+    assert stats["buckets"]["0.001"] == 1
+    assert stats["buckets"]["0.005"] == 2
+    assert stats["buckets"]["+inf"] == 1
+
+def test_budget():
+    huge = "<image><row width='100000' height='100000'/></image>"
+    with RenderServer(budget=RenderBudget(max_pixels=10 ** 6)) as server:
+        status, data = request(server, "POST", "/render", huge)
+        assert status == 413 and b"pixels" in data
+        status, _ = request(server, "POST", "/render", json.dumps({
+            "xml": "<image><row width='$size' height='$size'/></image>",
+            "data": {"size": 100000}}), {"Content-Type": "application/json"})
+        assert status == 413
+        assert request(server, "POST", "/render", card)[0] == 200
@@ -0,0 +1,74 @@
+import pytest
+from layoutimg import LayoutImage
+from layoutimg.renderer import ImageRenderer
+from layoutimg.sprites import SpriteRenderer
+
+badge = ("<col width='120' height='40' background-color='navy'><text "
+"font-size='20' text-color='white'>Badge</text></col>")
+
+def laid_out(text: str):
+    image = LayoutImage(text)
+    image.layout()
+    return image._tree
+
+def draw_both(tree, renderer_args=()):
+    """ Draw a tree with and without sprites, and return both renderers and
+        the sprite renderer """
+    plain = ImageRenderer(*renderer_args)
+    tree.draw(plain)
+    sprites = SpriteRenderer(tree)
+    renderer = ImageRenderer(*renderer_args)
+    sprites.draw(renderer)
+    return plain, renderer, sprites
+
+def test_repeated_subtrees():
+    tree = laid_out("<image>" + "".join(f"<row>{badge}<text font-size='20'>"
+    f"Row {i}</text></row>" for i in range(20)) + "</image>")
+    plain, renderer, sprites = draw_both(tree, tree.bounds())
+    assert renderer == plain
+    assert len(sprites._roots) == 20 and sprites.sprite_count == 1
+
+def test_outermost_subtree():
+    card = f"<row background-color='gray'>{badge}{badge}</row>"
+    tree = laid_out(f"<image>{card * 3}</image>")
+    plain, renderer, sprites = draw_both(tree, tree.bounds())
+    assert renderer == plain
+    assert [node.tag for node in sprites._roots] == ["row"] * 3
+
+def test_overflowing_text():
+    small = ("<col width='20' height='20' background-color='red'><text>"
+    "Overflow</text></col>")
+    tree = laid_out(f"<image><row>{small * 4}</row></image>")
+    plain, renderer, sprites = draw_both(tree, tree.bounds())
+    assert renderer == plain
+    assert not sprites._roots
+
+def test_expanding_renderer():
+    tree = laid_out(f"<image><row>{badge * 3}</row></image>")
+    plain, renderer, sprites = draw_both(tree)
+    assert renderer == plain
+
+def test_generate_with_sprites():
+    text = f"<image><row>{badge * 5}</row></image>"
+    image = LayoutImage(text)
+    image.generate()
+    without = LayoutImage(text)
+    without.generate(sprites=False)
+    assert image._renderer == without._renderer
+
+@pytest.mark.parametrize("text", [
+    # The background of the sprite is covered by a node inside it
+    "<image background-color='yellow'>" + "<row background-color='green'>"
+    "<text background-color='black'>Wg</text></row>" * 2 + "</image>",
+    # The sprites are covered by a node drawn after them
+    "<image>" + badge * 3 + "<col width='500' height='200' x='0' y='0' "
+    "background-color='red'/></image>",
+])
+def test_sprites_and_culling(text: str):
+    images = []
+    for sprites, cull in [(True, True), (True, False), (False, True),
+    (False, False)]:
+        image = LayoutImage(text)
+        image.generate(sprites=sprites, cull=cull)
+        images.append(image._renderer)
+    assert all(image == images[-1] for image in images)
@@ -0,0 +1,28 @@
+import pytest
+from layoutimg.renderer import ImageRenderer, TextMetrics
+
+def test_matches_renderer_bbox():
+    metrics = TextMetrics()
+    renderer = ImageRenderer()
+    for text in ("Kills:", "Deaths:", "gh", "Two\nlines", ""):
+        bbox = renderer.draw_text(0, 0, text, font_size=40, only_bbox=True)
+        assert metrics.measure(text, None, 40).bbox == bbox
+
+def test_repeated_measure_cached():
+    metrics = TextMetrics()
+    first = metrics.measure("Kills:", None, 50)
+    assert metrics.measure("Kills:", None, 50) is first
+    assert metrics.stats()["hits"] == 1 and metrics.stats()["misses"] == 1
+
+def test_measure_many():
+    metrics = TextMetrics()
+    texts = ["Kills:", "Deaths:", "Kills:"]
+    measures = metrics.measure_many(texts, None, 50)
+    assert measures == [metrics.measure(text, None, 50) for text in texts]
+    assert measures[0].advance > 0
+    assert metrics.stats()["misses"] == 2
+
+def test_lru_eviction():
+    metrics = TextMetrics(max_size=2)
+    metrics.measure_many(["a", "b", "c"], None, 20)
+    assert len(metrics) == 2 and metrics.stats()["evictions"] == 1
@@ -0,0 +1,78 @@
+import pytest
+import io
+import pathlib
+from PIL import Image
+from layoutimg import LayoutImage
+from layoutimg.renderer.pngwriter import PNGWriter
+from layoutimg.spatialindex import SpatialIndex
+
+files = list(pathlib.Path("examples/").rglob("*.xml"))
+
+@pytest.mark.parametrize("filename", files)
+def test_tiled_same_as_generate(filename: str):
+    with open(filename, "r") as f:
+        text = f.read()
+    image = LayoutImage(text)
+    image.generate()
+    output = io.BytesIO()
+    LayoutImage(text).save_tiled(output, tile_size=50)
+    tiled = Image.open(output)
+    assert tiled.size == image._renderer.image.size
+    assert tiled.tobytes() == image._renderer.image.tobytes()
+
+def test_spatial_index():
+    index = SpatialIndex(10)
+    index.insert((0, 0, 100, 100), "background")
+    index.insert((50, 50, 5, 5), "small")
+    index.insert((5, 5, 10, 10), "corner")
+    assert index.query((0, 0, 10, 10)) == ["background", "corner"]
+    assert index.query((52, 52, 30, 30)) == ["background", "small"]
+    assert index.query((200, 200, 10, 10)) == []
+    index.remove((0, 0, 100, 100), "background")
+    assert index.query((0, 0, 10, 10)) == ["corner"] and len(index) == 2
+    with pytest.raises(KeyError):
+        index.remove((0, 0, 100, 100), "background")
+
+def test_spatial_index_compacts():
+    index = SpatialIndex(10)
+    index.insert((0, 0, 100, 100), "background")
+    for i in range(1000):
+        index.insert((i % 50, 0, 10, 10), "moving")
+        index.insert((5, 5, 10, 10), "corner")
+        index.remove((i % 50, 0, 10, 10), "moving")
+        index.remove((5, 5, 10, 10), "corner")
+    index.insert((5, 5, 10, 10), "corner")
+    assert len(index) == 2 and len(index._entries) < 100
+    assert index.query((0, 0, 10, 10)) == ["background", "corner"]
+    index.remove((5, 5, 10, 10), "corner")
+    assert index.query((0, 0, 10, 10)) == ["background"]
+
+def test_find_containing():
+    index = SpatialIndex(10)
+    index.insert((5, 5, 10, 10), "corner")
+    index.insert((0, 0, 100, 100), "background")
+    assert index.find_containing((6, 6, 5, 5)) == "corner"
+    assert index.find_containing((6, 6, 5, 5), max_checks=0) is None
+    assert index.find_containing((50, 50, 60, 10)) is None
+    assert index.find_containing((8, 8, 50, 50)) == "background"
+    assert index.find_containing((8, 8, 50, 50), max_checks=1) is None
+
+def test_png_writer():
+    output = io.BytesIO()
+    writer = PNGWriter(output, 2, 3)
+    writer.write_rows(bytes(range(12)))
+    with pytest.raises(ValueError):
+        writer.close()
+    writer.write_rows(bytes(range(12, 18)))
+    writer.close()
+    assert Image.open(output).tobytes() == bytes(range(18))
+
+@pytest.mark.parametrize("filename", files)
+def test_threaded_same_as_serial(filename: str):
+    with open(filename, "r") as f:
+        text = f.read()
+    serial = LayoutImage(text)
+    serial.generate()
+    threaded = LayoutImage(text)
+    threaded.generate(threads=4, tile_size=40)
+    assert threaded._renderer == serial._renderer